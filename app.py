@@ -1,13 +1,12 @@
 from flask import Flask, render_template
 
 from flask_cors import CORS
-from models import db, User
+from models import db, User, apply_sqlite_pragmas
 from config import Config
-from werkzeug.security import generate_password_hash
+from dbpool import engine_options
+from compression import init_compression
 import sys
 import os
-import webbrowser
-from threading import Timer
 
 # Support PyInstaller frozen paths
 if getattr(sys, 'frozen', False):
@@ -20,9 +19,13 @@ static_dir = os.path.join(base_dir, 'static')
 
 app = Flask(__name__, template_folder=template_dir, static_folder=static_dir)
 app.config.from_object(Config)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
 CORS(app)
+init_compression(app)
 
 db.init_app(app)
+with app.app_context():
+    apply_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
 
 from flask_login import LoginManager
 login_manager = LoginManager()
@@ -34,36 +37,17 @@ def load_user(user_id):
     return User.query.get(int(user_id))
 
 
-# Ensure upload directory exists (Ignore on read-only environments like Vercel)
-try:
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-except:
-    pass
-
-with app.app_context():
-    try:
-        db.create_all()
-        # Create default admin if not exists
-        if not User.query.filter_by(username='admin').first():
-            admin = User(
-                username='admin',
-                password_hash=generate_password_hash('admin122'),
-                role='admin'
-            )
-            db.session.add(admin)
-            db.session.commit()
-    except:
-        pass
+# One-time setup (upload folder, tables, migrations, default admin) is not run
+# at import so gunicorn workers and serverless handlers start fast; run
+# `flask --app app init` on deploy. `python app.py` runs it automatically.
 
 # Import routes after app initialization to avoid circular imports
 from routes import main_bp
 app.register_blueprint(main_bp)
 
-try:
-    import webview
-    HAS_WEBVIEW = True
-except ImportError:
-    HAS_WEBVIEW = False
+# CLI maintenance commands (flask --app app <command>)
+from commands import register_commands
+register_commands(app)
 
 from threading import Thread
 
@@ -72,11 +56,26 @@ def start_flask():
     app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False)
 
 if __name__ == '__main__':
+    # Invoice rendering uses a process pool; required for the frozen desktop build
+    import multiprocessing
+    multiprocessing.freeze_support()
+
+    from commands import bootstrap, start_expiry_timer
+    with app.app_context():
+        bootstrap()
+    start_expiry_timer(app, app.config['EXPIRY_SWEEP_INTERVAL'])
+
     # Start Flask in a background thread
     t = Thread(target=start_flask)
     t.daemon = True
     t.start()
 
+    try:
+        import webview
+        HAS_WEBVIEW = True
+    except ImportError:
+        HAS_WEBVIEW = False
+
     # Only start desktop window if we are on a PC and not on a server
     if HAS_WEBVIEW and getattr(sys, 'frozen', False):
         webview.create_window('Boshkash Academy', 'http://127.0.0.1:5000', width=1280, height=800)
@@ -0,0 +1,201 @@
+"""Micro-benchmarks for hot paths, run against a throwaway SQLite database.
+
+    python bench.py import [--rows 500]
+    python bench.py coldstart [--runs 5] [--handler app.py] [--fresh-db] [--root DIR]
+    python bench.py sqlite [--seconds 5] [--readers 4] [--writers 2]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+
+def logged_in_client():
+    from app import app
+    from commands import bootstrap
+    with app.app_context():
+        bootstrap()
+    client = app.test_client()
+    client.post('/api/login', json={'username': 'admin', 'password': 'admin122'})
+    return client
+
+
+def bench_import(args):
+    client = logged_in_client()
+    players = [{'full_name': f'Player {i}', 'age': 8 + i % 10, 'team': 'U12'} for i in range(args.rows)]
+
+    start = time.perf_counter()
+    for player in players:
+        client.post('/api/players', json=player)
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    response = client.post('/api/players/import', json=players)
+    bulk = time.perf_counter() - start
+    assert response.status_code == 200, response.json
+
+    print(f"single-row POST: {args.rows / single:10.0f} players/s ({single:.3f}s)")
+    print(f"bulk import:     {args.rows / bulk:10.0f} players/s ({bulk:.3f}s)")
+    print(f"speedup:         {single / bulk:10.1f}x")
+
+
+# Deploy-time setup, run in its own process so it stays out of the timings
+BOOTSTRAP_SNIPPET = """
+import sys
+import {module} as handler
+# The module that created the Flask app (e.g. app.py behind api/index.py);
+# the academy app defines bootstrap() there, the root app in commands.py
+bootstrap = getattr(sys.modules[handler.app.import_name], 'bootstrap', None)
+if bootstrap is None:
+    from commands import bootstrap
+with handler.app.app_context():
+    bootstrap()
+"""
+
+COLDSTART_SNIPPET = """
+import time
+start = time.perf_counter()
+from {module} import app
+imported = time.perf_counter()
+client = app.test_client()
+login = client.post('/api/login', json={{'username': 'admin', 'password': 'admin122'}})
+assert login.status_code == 200, login.status_code
+before = time.perf_counter()
+response = client.get('/api/dashboard/stats')
+done = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(imported - start, done - before, response.status_code)
+"""
+
+
+def _project_root(directory):
+    """Nearest directory at or above ``directory`` holding an app.py."""
+    path = directory
+    while not os.path.isfile(os.path.join(path, 'app.py')):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return directory
+        path = parent
+    return path
+
+
+def bench_coldstart(args):
+    import statistics
+    import subprocess
+
+    directory, module = os.path.split(os.path.abspath(args.handler))
+    module = module[:-3] if module.endswith('.py') else module
+    root = os.path.abspath(args.root) if args.root else _project_root(directory)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([directory, root]))
+    # Run from a scratch directory so bootstrap's upload folder lands there
+    workdir = tempfile.mkdtemp()
+
+    def run(snippet):
+        out = subprocess.run([sys.executable, '-c', snippet.format(module=module)],
+                             cwd=workdir, env=env, capture_output=True, text=True)
+        if out.returncode:
+            sys.exit(f"{args.handler} failed:\n{out.stderr}")
+        return out.stdout
+
+    imports, firsts = [], []
+    for i in range(args.runs):
+        if args.fresh_db:
+            # Ephemeral container: nothing on disk from a previous start
+            env['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'cold.db')
+        if args.fresh_db or i == 0:
+            run(BOOTSTRAP_SNIPPET)
+        imported, first, status = run(COLDSTART_SNIPPET).split()[-3:]
+        imports.append(float(imported) * 1000)
+        firsts.append(float(first) * 1000)
+
+    print(f"handler {args.handler}, app from {root} ({args.runs} fresh processes, first stats response HTTP {status})")
+    print(f"import:                   median {statistics.median(imports):7.1f} ms")
+    print(f"first DB-backed response: median {statistics.median(firsts):7.1f} ms")
+    print(f"import + first response:  median {statistics.median(i + f for i, f in zip(imports, firsts)):7.1f} ms")
+
+
+def _sqlite_workload(pragmas, args):
+    import threading
+    from sqlalchemy import create_engine, text
+    from models import db, apply_sqlite_pragmas
+
+    engine = create_engine('sqlite:///' + os.path.join(tempfile.mkdtemp(), 'sqlite.db'),
+                           pool_size=args.readers + args.writers)
+    apply_sqlite_pragmas(engine, pragmas)
+    db.metadata.create_all(engine, tables=[db.metadata.tables['players']])
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO players (full_name, age) VALUES ('seed', 10)"))
+
+    counts = {'read': 0, 'write': 0, 'error': 0}
+    lock = threading.Lock()
+    stop = time.perf_counter() + args.seconds
+
+    def reader():
+        n = 0
+        while time.perf_counter() < stop:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT id, full_name FROM players ORDER BY id DESC LIMIT 20")).all()
+                conn.execute(text("SELECT COUNT(*) FROM players")).scalar()
+            n += 1
+        with lock:
+            counts['read'] += n
+
+    def writer():
+        n = errors = 0
+        while time.perf_counter() < stop:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text("INSERT INTO players (full_name, age) VALUES ('bench', 12)"))
+                n += 1
+            except Exception:
+                errors += 1
+        with lock:
+            counts['write'] += n
+            counts['error'] += errors
+
+    threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+    threads += [threading.Thread(target=writer) for _ in range(args.writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    engine.dispose()
+    return counts
+
+
+def bench_sqlite(args):
+    from config import Config
+
+    for label, pragmas in (('default', {}), ('tuned', Config.SQLITE_PRAGMAS)):
+        counts = _sqlite_workload(pragmas, args)
+        print(f"{label:8} reads/s {counts['read'] / args.seconds:9.0f}   "
+              f"writes/s {counts['write'] / args.seconds:8.0f}   errors {counts['error']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    p = sub.add_parser('import', help='bulk player import vs single-row POST')
+    p.add_argument('--rows', type=int, default=500)
+    p.set_defaults(func=bench_import)
+
+    p = sub.add_parser('coldstart', help='import-to-first-response time of a WSGI handler')
+    p.add_argument('--runs', type=int, default=5)
+    p.add_argument('--handler', default='app.py', help='module file exposing `app`')
+    p.add_argument('--fresh-db', action='store_true', help='new empty SQLite file per run')
+    p.add_argument('--root', help='project directory the handler imports `app` from '
+                                  '(default: nearest directory above the handler with an app.py)')
+    p.set_defaults(func=bench_coldstart)
+
+    p = sub.add_parser('sqlite', help='concurrent read/write throughput, default vs tuned pragmas')
+    p.add_argument('--seconds', type=float, default=5)
+    p.add_argument('--readers', type=int, default=4)
+    p.add_argument('--writers', type=int, default=2)
+    p.set_defaults(func=bench_sqlite)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
@@ -0,0 +1,86 @@
+"""Content-addressed storage for uploaded player files.
+
+Each distinct file body is stored once under ``<root>/<sha[:2]>/<sha>``; File
+rows point at it through ``blob_sha256`` and the ``blobs`` table counts the
+references (maintained by the File listeners in models.py). New bytes are
+staged under ``<root>/tmp`` and moved into place only after the row that
+references them has committed; a blob is removed from disk only after the
+transaction dropping its last reference has committed.
+"""
+import hashlib
+import os
+import shutil
+import uuid
+
+from uploads import COPY_BUFSIZE, file_sha256
+
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = root
+
+    def path_for(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def temp_path(self):
+        """A scratch path on the same disk, so ingest() is a rename."""
+        tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        return os.path.join(tmp_dir, uuid.uuid4().hex)
+
+    def stage_stream(self, stream):
+        """Copy ``stream`` to a scratch file, hashing on the way; returns (path, sha256, size).
+
+        Pass the path to ingest() once the row referencing the blob has committed.
+        """
+        tmp = self.temp_path()
+        digest = hashlib.sha256()
+        size = 0
+        with open(tmp, 'wb') as f:
+            for block in iter(lambda: stream.read(COPY_BUFSIZE), b''):
+                digest.update(block)
+                f.write(block)
+                size += len(block)
+        return tmp, digest.hexdigest(), size
+
+    def ingest(self, src_path, sha256=None):
+        """Move ``src_path`` into the store and return its hash.
+
+        Call this only after the File row referencing the blob has committed.
+        When the content is already stored the new copy is simply dropped: a
+        concurrent remove_unreferenced() sees the committed row and keeps it.
+        """
+        sha256 = sha256 or file_sha256(src_path)
+        dest = self.path_for(sha256)
+        if os.path.exists(dest):
+            os.remove(src_path)
+        else:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.move(src_path, dest)
+        return sha256
+
+    def remove_unreferenced(self, hashes, still_referenced):
+        """Delete the given blobs from disk unless ``still_referenced(sha)`` says otherwise.
+
+        The check runs after commit so a blob re-uploaded in the meantime, or
+        listed by a transaction that was rolled back, is kept. The blob is
+        moved aside before it is deleted and checked again, so an upload of the
+        same content committing in between either finds it gone and puts its
+        own copy in place, or gets it moved back. Returns the hashes removed.
+        """
+        removed = []
+        for sha256 in hashes:
+            if still_referenced(sha256):
+                continue
+            path = self.path_for(sha256)
+            doomed = self.temp_path()
+            try:
+                os.replace(path, doomed)
+            except OSError:
+                continue
+            if still_referenced(sha256):
+                os.replace(doomed, path)
+                continue
+            os.remove(doomed)
+            removed.append(sha256)
+        return removed
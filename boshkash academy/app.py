@@ -2,8 +2,10 @@ print("Starting Flask App...", flush=True)
 from flask import Flask, render_template
 
 from flask_cors import CORS
-from models import db, User
+from models import db, User, TableVersion, VERSIONED_TABLES
 from config import Config
+from dbpool import engine_options
+from compression import init_compression, precompress_static
 from werkzeug.security import generate_password_hash
 import os
 
@@ -18,7 +20,9 @@ static_dir = os.path.join(base_dir, 'static')
 
 app = Flask(__name__, template_folder=template_dir, static_folder=static_dir)
 app.config.from_object(Config)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
 CORS(app)
+init_compression(app)
 
 db.init_app(app)
 
@@ -32,32 +36,56 @@ def load_user(user_id):
     return User.query.get(int(user_id))
 
 
-# Ensure upload directory exists (Ignore on read-only environments like Vercel)
-try:
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-except:
-    pass
+def bootstrap():
+    """One-time setup: upload folder, tables and default admin.
 
-with app.app_context():
+    Not run at import so serverless cold starts stay fast; run
+    `flask --app app init` on deploy. `python app.py` runs it automatically.
+    """
+    # Ensure upload directory exists (Ignore on read-only environments like Vercel)
     try:
-        db.create_all()
-        # Create default admin if not exists
-        if not User.query.filter_by(username='admin').first():
-            admin = User(
-                username='admin',
-                password_hash=generate_password_hash('admin122'),
-                role='admin'
-            )
-            db.session.add(admin)
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    except:
+        pass
+
+    with app.app_context():
+        try:
+            db.create_all()
+            # Create default admin if not exists
+            if not User.query.filter_by(username='admin').first():
+                admin = User(
+                    username='admin',
+                    password_hash=generate_password_hash('admin122'),
+                    role='admin'
+                )
+                db.session.add(admin)
+                db.session.commit()
+                print("Default admin user created.")
+            # Counters behind the list ETags (see conditional_list in routes.py)
+            for name in VERSIONED_TABLES:
+                if not db.session.get(TableVersion, name):
+                    db.session.add(TableVersion(name=name, version=0))
             db.session.commit()
-            print("Default admin user created.")
-    except Exception as e:
-        print(f"DB Error or Read-Only Env: {e}")
+        except Exception as e:
+            print(f"DB Error or Read-Only Env: {e}")
+
+@app.cli.command('init')
+def init_command():
+    """Create tables and the default admin user."""
+    bootstrap()
+
+@app.cli.command('compress-static')
+def compress_static_command():
+    """Write .gz/.br variants of static assets for precompressed serving."""
+    # User uploads live under static/ too; they are served as stored
+    written = precompress_static(app.static_folder, exclude=[app.config['UPLOAD_FOLDER']])
+    print(f"Wrote {len(written)} precompressed files.")
 
 # Import routes after app initialization to avoid circular imports
 from routes import main_bp
 app.register_blueprint(main_bp)
 
 if __name__ == '__main__':
+    bootstrap()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,125 @@
+"""Negotiated gzip/brotli compression for API responses and static files.
+
+Dynamic responses above COMPRESS_MIN_SIZE with a compressible mimetype are
+encoded in an after_request hook. Static files are never compressed per
+request: if a precompressed ``<file>.br`` or ``<file>.gz`` sits next to the
+original (see ``flask --app app compress-static``) it is served instead.
+Brotli is used only when the optional ``brotli`` package is installed.
+"""
+import gzip
+import mimetypes
+import os
+
+from flask import request, send_from_directory
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+# Content-Encoding -> file suffix of the precompressed static variant
+STATIC_VARIANTS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _negotiate(offered):
+    """The offered encoding the client ranks highest, or None to send it as is.
+
+    q-values decide; on a tie the order of ``offered`` does. ``identity`` takes
+    part too, so a client preferring uncompressed bodies gets one.
+    """
+    best = request.accept_encodings.best_match(list(offered) + ['identity'])
+    return best if best != 'identity' else None
+
+
+def _dynamic_encodings():
+    return ['br', 'gzip'] if HAS_BROTLI else ['gzip']
+
+
+def compress_bytes(data, encoding, level):
+    if encoding == 'br':
+        # Brotli quality runs 0-11; map the gzip-style 1-9 level onto it
+        return brotli.compress(data, quality=min(11, level + 2))
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _add_vary(response):
+    response.vary.add('Accept-Encoding')
+
+
+def init_compression(app):
+    @app.before_request
+    def serve_precompressed_static():
+        if request.endpoint != 'static' or not app.static_folder:
+            return None
+        filename = request.view_args.get('filename', '')
+        original = os.path.join(app.static_folder, filename)
+        if not os.path.isfile(original):
+            return None
+        # Precompressed .br files need no brotli module to be served. Ignore
+        # variants left behind by an older version of the file.
+        variants = {encoding: original + suffix for encoding, suffix in STATIC_VARIANTS
+                    if os.path.isfile(original + suffix)
+                    and os.path.getmtime(original + suffix) >= os.path.getmtime(original)}
+        encoding = _negotiate(variants)
+        if encoding is None:
+            return None
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(app.static_folder, os.path.relpath(variants[encoding], app.static_folder),
+                                       mimetype=mimetype)
+        response.headers['Content-Encoding'] = encoding
+        _add_vary(response)
+        return response
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code != 200
+                or response.direct_passthrough
+                or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in app.config['COMPRESS_MIMETYPES']):
+            return response
+
+        _add_vary(response)
+        data = response.get_data()
+        if len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+        encoding = _negotiate(_dynamic_encodings())
+        if encoding is None:
+            return response
+
+        response.set_data(compress_bytes(data, encoding, app.config['COMPRESS_LEVEL']))
+        response.headers['Content-Encoding'] = encoding
+        # The encoded body differs byte-wise, so only a weak validator still holds
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+def precompress_static(static_folder, level=9, exclude=()):
+    """Write .gz (and .br when available) next to each compressible static file.
+
+    Directories in ``exclude`` (e.g. an upload folder inside static/) are skipped.
+    """
+    skip = {os.path.abspath(path) for path in exclude}
+    written = []
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) not in skip]
+        for name in files:
+            if name.endswith(('.gz', '.br')):
+                continue
+            mimetype = mimetypes.guess_type(name)[0] or ''
+            if not (mimetype.startswith('text/') or mimetype in ('application/javascript', 'application/json',
+                                                                 'image/svg+xml', 'application/manifest+json')):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            for encoding, suffix in STATIC_VARIANTS:
+                if encoding == 'br' and not HAS_BROTLI:
+                    continue
+                with open(path + suffix, 'wb') as f:
+                    f.write(compress_bytes(data, encoding, level))
+                written.append(path + suffix)
+    return written
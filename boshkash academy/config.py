@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-prod'
@@ -9,4 +10,34 @@ class Config:
     if not SQLALCHEMY_DATABASE_URI:
         SQLALCHEMY_DATABASE_URI = 'sqlite:///academy.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Postgres connection pool, see dbpool.py ('queue' or 'null'; use 'null'
+    # on the serverless handlers in api/ and functions/)
+    DB_POOL_MODE = os.environ.get('DB_POOL_MODE', 'queue')
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 5))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') != '0'
+    DB_POOL_SLOW_MS = int(os.environ.get('DB_POOL_SLOW_MS', 100))
     UPLOAD_FOLDER = os.path.join(os.getcwd(), 'static', 'uploads')
+    # Response compression (see compression.py)
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+    COMPRESS_MIMETYPES = ['application/json', 'application/x-ndjson', 'text/csv',
+                          'text/html', 'text/css', 'text/plain', 'application/javascript']
+    # Rendered invoice PDFs, evicted least-recently-used beyond the size cap
+    INVOICE_CACHE_DIR = os.environ.get('INVOICE_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'boshkash_invoices')
+    INVOICE_CACHE_MAX_BYTES = int(os.environ.get('INVOICE_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+    # Processes rendering invoices for the month export
+    INVOICE_WORKERS = int(os.environ.get('INVOICE_WORKERS', 2))
+    # Thumbnails of image uploads and first pages of PDFs (see previews.py)
+    PREVIEW_FOLDER = os.environ.get('PREVIEW_FOLDER') or os.path.join(UPLOAD_FOLDER, 'previews')
+    PREVIEW_SIZE = int(os.environ.get('PREVIEW_SIZE', 256))
+    PREVIEW_WORKERS = int(os.environ.get('PREVIEW_WORKERS', 1))
+    # Chunked uploads (see uploads.py) are staged here until complete; keep it on
+    # the same disk as UPLOAD_FOLDER so finished files are moved, not copied
+    UPLOAD_STAGING_DIR = os.environ.get('UPLOAD_STAGING_DIR') or os.path.join(UPLOAD_FOLDER, '.incoming')
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024))
+    UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', 1024 * 1024 * 1024))
+    # Unfinished uploads older than this many seconds are deleted
+    UPLOAD_STALE_SECONDS = int(os.environ.get('UPLOAD_STALE_SECONDS', 24 * 3600))
@@ -0,0 +1,102 @@
+"""Connection pool settings for server databases and checkout wait tracking.
+
+SQLite keeps Flask-SQLAlchemy's defaults; for Postgres the pool is chosen by
+DB_POOL_MODE:
+
+- ``queue`` (default): a bounded pool per gunicorn worker, sized by
+  DB_POOL_SIZE + DB_MAX_OVERFLOW.
+- ``null``: no pooling in the app; every checkout opens a fresh connection.
+  Use this on serverless handlers, normally behind an external pooler such as
+  PgBouncer or a provider's pooled connection string.
+"""
+import logging
+import threading
+import time
+
+from sqlalchemy.pool import NullPool, QueuePool
+
+log = logging.getLogger(__name__)
+
+
+class CheckoutStats:
+    """Thread-safe running totals of how long checkouts waited."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+            self.slow = 0
+
+    def record(self, seconds, slow_threshold):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            if seconds >= slow_threshold:
+                self.slow += 1
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'checkouts': self.count,
+                'avg_wait_ms': round(self.total / self.count * 1000, 3) if self.count else 0,
+                'max_wait_ms': round(self.max * 1000, 3),
+                'slow_checkouts': self.slow,
+            }
+
+
+checkout_stats = CheckoutStats()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    slow_threshold = 0.1
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            checkout_stats.record(waited, self.slow_threshold)
+            if waited >= self.slow_threshold:
+                log.warning("DB pool checkout waited %.0f ms (%s)", waited * 1000, self.status())
+
+
+class TimedNullPool(NullPool):
+    """NullPool variant; the "wait" is the time to open a new connection."""
+
+    slow_threshold = 0.1
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            checkout_stats.record(time.perf_counter() - start, self.slow_threshold)
+
+
+def engine_options(config):
+    """Build SQLALCHEMY_ENGINE_OPTIONS from the DB_POOL_* settings."""
+    if config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        return config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+
+    TimedQueuePool.slow_threshold = TimedNullPool.slow_threshold = config['DB_POOL_SLOW_MS'] / 1000
+    options = {'pool_pre_ping': config['DB_POOL_PRE_PING']}
+    if config['DB_POOL_MODE'] == 'null':
+        options['poolclass'] = TimedNullPool
+    else:
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+            pool_recycle=config['DB_POOL_RECYCLE'],
+        )
+    return options
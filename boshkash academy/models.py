@@ -71,6 +71,10 @@ class Subscription(db.Model):
             'status': self.status
         }
 
+def qr_payload(invoice_number, paid_amount, player_name, payment_date):
+    """Text encoded in the invoice QR code."""
+    return f"Invoice:{invoice_number}\nAmount:{paid_amount}\nPlayer:{player_name}\nDate:{payment_date}"
+
 class Payment(db.Model):
     __tablename__ = 'payments'
     id = db.Column(db.Integer, primary_key=True)
@@ -109,6 +113,31 @@ class File(db.Model):
             'uploaded_at': self.uploaded_at.isoformat()
         }
 
+class TableVersion(db.Model):
+    """Change counter per table, bumped by write routes; used for ETags."""
+    __tablename__ = 'table_versions'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+VERSIONED_TABLES = ('players', 'subscriptions', 'payments')
+
+def bump_table_versions(*names):
+    """Increment the change counters in the current transaction."""
+    table = TableVersion.__table__
+    result = db.session.execute(
+        table.update().where(table.c.name.in_(names)).values(version=table.c.version + 1)
+    )
+    if result.rowcount < len(names):
+        # Counter rows are seeded by bootstrap(); recreate any that are missing
+        existing = set(db.session.scalars(db.select(table.c.name).where(table.c.name.in_(names))))
+        db.session.execute(table.insert(), [{'name': n, 'version': 1} for n in names if n not in existing])
+
+def get_table_versions(*names):
+    rows = db.session.query(TableVersion.name, TableVersion.version) \
+        .filter(TableVersion.name.in_(names)).all()
+    versions = dict(rows)
+    return [versions.get(name, 0) for name in names]
+
 class AuditLog(db.Model):
     __tablename__ = 'audit_log'
     id = db.Column(db.Integer, primary_key=True)
@@ -1,12 +1,42 @@
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, current_app
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
-from models import db, User, Player, Subscription, Payment, File, AuditLog
+from models import db, User, Player, Subscription, Payment, File, AuditLog, bump_table_versions, \
+    get_table_versions
+from uploads import UploadError, UploadStore
 from datetime import datetime
+from functools import wraps
+import hashlib
 import os
 
 main_bp = Blueprint('main', __name__)
 
+def conditional_list(*tables):
+    """Serve a GET list with an ETag derived from the tables' change versions.
+
+    A matching If-None-Match is answered with 304 after reading only the
+    version counters, never the rows themselves.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = get_table_versions(*tables)
+            key = f"{request.path}?{request.query_string.decode()}|{versions}"
+            etag = hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+            # Weak match: compressed responses carry a weak ETag
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            # Always revalidate; the 304 path is cheap
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
 # --- View Routes ---
 
 @main_bp.route('/')
@@ -26,6 +56,14 @@ def login_page():
 def dashboard():
     return render_template('dashboard.html', user=current_user)
 
+@main_bp.route('/sw.js')
+def service_worker():
+    # Served from the root so the worker's scope covers /dashboard and /api/*
+    from flask import send_from_directory, current_app
+    response = send_from_directory(current_app.static_folder, 'sw.js', mimetype='application/javascript')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 # --- API Routes ---
 
 @main_bp.route('/api/login', methods=['POST'])
@@ -49,11 +87,74 @@ def api_logout():
 
 # --- Player Management ---
 
+PLAYER_SORT_FIELDS = ('id', 'full_name', 'age', 'position', 'team', 'created_at')
+PLAYER_FILTER_FIELDS = ('full_name', 'position', 'team', 'phone', 'parent_name')
+MAX_PAGE_SIZE = 500
+
+def _filter_players(query, args):
+    """Apply team/position/age filters from the query string.
+
+    Accepts plain params (?team=U12&min_age=8&max_age=12) as well as
+    Tabulator's remote filter array (filter[0][field]=team&filter[0][value]=U12).
+    """
+    if args.get('team'):
+        query = query.filter(Player.team == args['team'])
+    if args.get('position'):
+        query = query.filter(Player.position == args['position'])
+    if args.get('min_age', type=int) is not None:
+        query = query.filter(Player.age >= args.get('min_age', type=int))
+    if args.get('max_age', type=int) is not None:
+        query = query.filter(Player.age <= args.get('max_age', type=int))
+
+    i = 0
+    while f'filter[{i}][field]' in args:
+        field = args.get(f'filter[{i}][field]')
+        value = args.get(f'filter[{i}][value]', '')
+        if field in PLAYER_FILTER_FIELDS and value:
+            query = query.filter(getattr(Player, field).ilike(f'%{value}%'))
+        elif field == 'age' and value.isdigit():
+            query = query.filter(Player.age == int(value))
+        i += 1
+    return query
+
 @main_bp.route('/api/players', methods=['GET'])
 @login_required
+@conditional_list('players')
 def get_players():
-    players = Player.query.all()
-    return jsonify([p.to_dict() for p in players])
+    # Without paging params keep the legacy full-list response (used by selects)
+    if not any(k in request.args for k in ('page', 'size', 'after')):
+        players = Player.query.all()
+        return jsonify([p.to_dict() for p in players])
+
+    size = max(1, min(request.args.get('size', 10, type=int), MAX_PAGE_SIZE))
+    query = _filter_players(Player.query, request.args)
+    total = query.order_by(None).count()
+
+    # Keyset mode: ?after=<last id seen>, always ordered by id
+    if 'after' in request.args:
+        after = request.args.get('after', 0, type=int)
+        players = query.filter(Player.id > after).order_by(Player.id).limit(size).all()
+        return jsonify({
+            'data': [p.to_dict() for p in players],
+            'last_row': total,
+            'next_cursor': players[-1].id if len(players) == size else None
+        })
+
+    # Offset mode, shaped for Tabulator's remote pagination
+    sort_field = request.args.get('sort[0][field]', request.args.get('sort', 'id'))
+    sort_dir = request.args.get('sort[0][dir]', request.args.get('dir', 'asc'))
+    if sort_field not in PLAYER_SORT_FIELDS:
+        sort_field = 'id'
+    column = getattr(Player, sort_field)
+    order = column.desc() if sort_dir == 'desc' else column.asc()
+
+    page = max(1, request.args.get('page', 1, type=int))
+    players = query.order_by(order, Player.id).offset((page - 1) * size).limit(size).all()
+    return jsonify({
+        'data': [p.to_dict() for p in players],
+        'last_page': max(1, -(-total // size)),
+        'last_row': total
+    })
 
 @main_bp.route('/api/players', methods=['POST'])
 @login_required
@@ -73,6 +174,7 @@ def add_player():
     # Log action
     log = AuditLog(user_id=current_user.id, action=f"Added player {new_player.full_name}")
     db.session.add(log)
+    bump_table_versions('players')
     
     db.session.commit()
     return jsonify({'success': True, 'player': new_player.to_dict()})
@@ -90,22 +192,118 @@ def update_player(id):
     player.phone = data.get('phone', player.phone)
     player.parent_name = data.get('parent_name', player.parent_name)
     player.medical_notes = data.get('medical_notes', player.medical_notes)
+    bump_table_versions('players')
     
     db.session.commit()
     return jsonify({'success': True, 'player': player.to_dict()})
 
+PLAYER_EDIT_FIELDS = {
+    # field: max length (None for unbounded text)
+    'full_name': 100,
+    'position': 50,
+    'team': 50,
+    'phone': 20,
+    'parent_name': 100,
+    'medical_notes': None,
+}
+
+def _validate_player_edit(raw):
+    """Return (clean_fields, errors) for the fields present in ``raw``."""
+    errors = []
+    row = {}
+    for field, max_len in PLAYER_EDIT_FIELDS.items():
+        if field not in raw:
+            continue
+        value = raw.get(field)
+        value = str(value).strip() if value is not None else ''
+        if max_len and len(value) > max_len:
+            errors.append(f"{field} longer than {max_len} characters")
+        row[field] = value or None
+    if 'full_name' in row and not row['full_name']:
+        errors.append('full_name is required')
+    if 'age' in raw:
+        try:
+            row['age'] = int(str(raw.get('age', '')).strip())
+            if row['age'] < 0:
+                raise ValueError
+        except ValueError:
+            errors.append('age must be a non-negative integer')
+    return row, errors
+
+@main_bp.route('/api/players', methods=['PATCH'])
+@login_required
+def patch_players():
+    """Apply partial updates to many players in one transaction.
+
+    Body: [{"id": 1, "team": "U12"}, {"id": 7, "age": 11}, ...]
+    """
+    changes = request.get_json(silent=True)
+    if isinstance(changes, dict):
+        changes = changes.get('updates')
+    if not isinstance(changes, list) or not changes:
+        return jsonify({'success': False, 'message': 'No updates given'}), 400
+
+    # Merge repeated edits of the same row, later fields winning
+    by_id = {}
+    for change in changes:
+        if not isinstance(change, dict) or not isinstance(change.get('id'), int):
+            return jsonify({'success': False, 'message': 'Each update needs an integer id'}), 400
+        by_id.setdefault(change['id'], {}).update(change)
+
+    # Tabulator sends the whole row; ignore read-only keys it includes
+    editable = set(PLAYER_EDIT_FIELDS) | {'age'}
+    errors, clean = [], {}
+    for player_id, change in by_id.items():
+        row, row_errors = _validate_player_edit({k: v for k, v in change.items() if k in editable})
+        if row_errors:
+            errors.append({'id': player_id, 'errors': row_errors})
+        clean[player_id] = row
+
+    players = {p.id: p for p in Player.query.filter(Player.id.in_(clean)).all()}
+    errors.extend({'id': i, 'errors': ['player not found']} for i in clean if i not in players)
+    if errors:
+        return jsonify({'success': False, 'message': 'Validation failed', 'errors': errors}), 400
+
+    for player_id, row in clean.items():
+        for field, value in row.items():
+            setattr(players[player_id], field, value)
+    bump_table_versions('players')
+    db.session.commit()
+    return jsonify({'success': True, 'players': [p.to_dict() for p in players.values()]})
+
 @main_bp.route('/api/players/<int:id>', methods=['DELETE'])
 @login_required
 def delete_player(id):
     player = Player.query.get_or_404(id)
     db.session.delete(player)
+    bump_table_versions('players')
     db.session.commit()
     return jsonify({'success': True})
 
+# --- Admin ---
+
+@main_bp.route('/api/admin/db-pool', methods=['GET'])
+@login_required
+def db_pool_stats():
+    """Connection pool status and checkout wait times for sizing the pool."""
+    from dbpool import checkout_stats
+
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Admin only'}), 403
+    pool = db.engine.pool
+    if request.args.get('reset'):
+        checkout_stats.reset()
+    return jsonify({
+        'pool': type(pool).__name__,
+        'status': pool.status(),
+        'wait': checkout_stats.to_dict(),
+    })
+
 # --- Subscriptions & Payments ---
 
 @main_bp.route('/api/subscriptions', methods=['GET'])
 @login_required
+@conditional_list('subscriptions', 'players')
 def get_subscriptions():
     subs = Subscription.query.all()
     # Enrich with player name
@@ -145,6 +343,7 @@ def add_subscription():
     )
     # ... (previous code)
     db.session.add(new_payment)
+    bump_table_versions('subscriptions', 'payments')
     
     db.session.commit()
     
@@ -176,6 +375,7 @@ def delete_subscription(id):
     # Delete associated payments first or handle via cascade (doing manual here for safety)
     Payment.query.filter_by(subscription_id=id).delete()
     db.session.delete(sub)
+    bump_table_versions('subscriptions', 'payments')
     db.session.commit()
     return jsonify({'success': True})
 
@@ -197,34 +397,127 @@ def upload_file():
         from werkzeug.utils import secure_filename
         filename = secure_filename(file.filename)
         
-        # Create player specific folder
-        player_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], str(player_id))
-        os.makedirs(player_folder, exist_ok=True)
-        
-        file_path = os.path.join(player_folder, filename)
-        file.save(file_path)
-        
-        # Save to DB
-        # Store relative path for portability
-        rel_path = os.path.join(str(player_id), filename)
+        file.save(_player_file_path(player_id, filename))
         
-        new_file = File(
-            player_id=player_id,
-            file_path=rel_path,
-            file_type=filename.rsplit('.', 1)[1].lower() if '.' in filename else 'unknown'
-        )
-        db.session.add(new_file)
-        db.session.commit()
-        
-        return jsonify({'success': True, 'file': new_file.to_dict()})
+        new_file = _add_player_file(player_id, filename)
+        return jsonify({'success': True, 'file': _file_dict(new_file)})
     
     return jsonify({'success': False, 'message': 'Invalid data'}), 400
 
+def _player_file_path(player_id, filename):
+    """Where a player's upload is saved, clearing the preview of any file it replaces."""
+    # Create player specific folder
+    player_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], str(player_id))
+    os.makedirs(player_folder, exist_ok=True)
+    
+    file_path = os.path.join(player_folder, filename)
+    if os.path.exists(file_path):
+        # Overwritten in place: the old content's preview is no longer reachable
+        _remove_preview(file_path)
+    return file_path
+
+def _add_player_file(player_id, filename):
+    # Store relative path for portability
+    rel_path = os.path.join(str(player_id), filename)
+    
+    new_file = File(
+        player_id=player_id,
+        file_path=rel_path,
+        file_type=filename.rsplit('.', 1)[1].lower() if '.' in filename else 'unknown'
+    )
+    db.session.add(new_file)
+    db.session.commit()
+    _queue_preview(os.path.join(current_app.config['UPLOAD_FOLDER'], rel_path), new_file.file_type)
+    return new_file
+
+def _upload_store():
+    return UploadStore(current_app.config['UPLOAD_STAGING_DIR'], current_app.config['UPLOAD_MAX_SIZE'])
+
+def _upload_status(store, upload_id):
+    meta = store.meta(upload_id)
+    return {'success': True, 'upload_id': upload_id, 'filename': meta['filename'],
+            'size': meta['size'], 'received': store.received(upload_id),
+            'chunk_size': current_app.config['UPLOAD_CHUNK_SIZE']}
+
+@main_bp.errorhandler(UploadError)
+def upload_error(e):
+    return jsonify({'success': False, 'message': e.message}), e.status
+
+@main_bp.route('/api/uploads', methods=['POST'])
+@login_required
+def start_upload():
+    """Begin a chunked upload: {player_id, filename, size}.
+
+    Send the bytes with PUT /api/uploads/<id>?offset=N, then POST
+    /api/uploads/<id>/complete with {sha256}. GET /api/uploads/<id> reports
+    how many bytes arrived, which is where an interrupted client resumes.
+    """
+    from werkzeug.utils import secure_filename
+
+    data = request.get_json(silent=True) or {}
+    player = db.session.get(Player, data.get('player_id') or 0)
+    if not player:
+        return jsonify({'success': False, 'message': 'Player not found'}), 404
+    filename = secure_filename(data.get('filename') or '')
+    if not filename:
+        return jsonify({'success': False, 'message': 'filename is required'}), 400
+
+    store = _upload_store()
+    store.purge_stale(current_app.config['UPLOAD_STALE_SECONDS'])
+    upload_id = store.create(data.get('size'), data.get('sha256'),
+                             player_id=player.id, filename=filename, user_id=current_user.id)
+    return jsonify(_upload_status(store, upload_id)), 201
+
+@main_bp.route('/api/uploads/<upload_id>', methods=['GET'])
+@login_required
+def upload_status(upload_id):
+    return jsonify(_upload_status(_upload_store(), upload_id))
+
+@main_bp.route('/api/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def upload_chunk(upload_id):
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'success': False, 'message': 'offset is required'}), 400
+    store = _upload_store()
+    # Read the body as a stream so a chunk is never held in memory whole
+    received = store.write_chunk(upload_id, offset, request.stream)
+    return jsonify({'success': True, 'upload_id': upload_id, 'received': received})
+
+@main_bp.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_upload(upload_id):
+    store = _upload_store()
+    meta = store.meta(upload_id)
+    data = request.get_json(silent=True) or {}
+    store.finish(upload_id, _player_file_path(meta['player_id'], meta['filename']), data.get('sha256'))
+    new_file = _add_player_file(meta['player_id'], meta['filename'])
+    return jsonify({'success': True, 'file': _file_dict(new_file)})
+
+@main_bp.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_upload(upload_id):
+    store = _upload_store()
+    store.meta(upload_id)
+    store.discard(upload_id)
+    return jsonify({'success': True})
+
 @main_bp.route('/api/players/<int:player_id>/files', methods=['GET'])
 @login_required
 def get_player_files(player_id):
     files = File.query.filter_by(player_id=player_id).all()
-    return jsonify([f.to_dict() for f in files])
+    return jsonify([_file_dict(f) for f in files])
+
+def _file_dict(file):
+    """File.to_dict() plus a thumbnail URL versioned by the preview key, or None."""
+    from previews import PREVIEW_TYPES
+
+    data = file.to_dict()
+    data['thumbnail_url'] = None
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.file_path)
+    if file.file_type in PREVIEW_TYPES and os.path.isfile(path):
+        data['thumbnail_url'] = url_for('main.file_thumbnail', file_id=file.id, v=_preview_key(path)[:16])
+    return data
 
 @main_bp.route('/api/files/<int:file_id>/download', methods=['GET'])
 @login_required
@@ -239,14 +532,82 @@ def download_file(file_id):
     
     return send_from_directory(directory, filename, as_attachment=True)
 
+def _preview_cache():
+    from previews import PreviewCache
+    return PreviewCache(current_app.config['PREVIEW_FOLDER'], current_app.config['PREVIEW_SIZE'])
+
+def _preview_key(path):
+    """Cache key for the preview of the file at ``path``.
+
+    Uploads here are overwritten in place under the same name, so the key
+    covers size and modification time as well as the path.
+    """
+    import hashlib
+    st = os.stat(path)
+    rel_path = os.path.relpath(path, current_app.config['UPLOAD_FOLDER'])
+    return hashlib.sha256(f"{rel_path}:{st.st_size}:{st.st_mtime_ns}".encode('utf-8')).hexdigest()
+
+def _queue_preview(path, file_type):
+    """Start rendering the thumbnail of the upload at ``path``; returns its status or None."""
+    from previews import PREVIEW_TYPES
+
+    if file_type not in PREVIEW_TYPES or not os.path.isfile(path):
+        return None
+    try:
+        return _preview_cache().submit(path, _preview_key(path), file_type, current_app.config['PREVIEW_WORKERS'])
+    except OSError:
+        # e.g. read-only hosts; the upload itself has already succeeded
+        return None
+
+def _remove_preview(path):
+    try:
+        _preview_cache().remove(_preview_key(path))
+    except OSError:
+        pass
+
+@main_bp.route('/api/files/<int:file_id>/thumbnail', methods=['GET'])
+@login_required
+def file_thumbnail(file_id):
+    """Small JPEG preview; 202 while it is still being rendered.
+
+    Linked as ``?v=<key>`` from the file listing (see _file_dict). A matching
+    version can be cached for good, since a new upload under the same name
+    changes the key and so the URL; anything else is revalidated.
+    """
+    from flask import send_file
+
+    file = File.query.get_or_404(file_id)
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.file_path)
+    status = _queue_preview(path, file.file_type)
+    if status == 'done':
+        key = _preview_key(path)
+        versioned = request.args.get('v') == key[:16]
+        response = send_file(_preview_cache().path_for(key), mimetype='image/jpeg',
+                             etag=f"{key[:32]}-{current_app.config['PREVIEW_SIZE']}",
+                             max_age=365 * 24 * 3600 if versioned else None, conditional=True)
+        response.cache_control.public = False
+        response.cache_control.private = True
+        if versioned:
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response
+    if status == 'pending':
+        response = jsonify({'success': True, 'status': 'pending'})
+        response.status_code = 202
+        response.headers['Retry-After'] = '2'
+        return response
+    return jsonify({'success': False, 'message': 'No preview for this file'}), 404
+
 @main_bp.route('/api/files/<int:file_id>', methods=['DELETE'])
 @login_required
 def delete_file(file_id):
     file = File.query.get_or_404(file_id)
     
-    # Remove from disk
+    # Remove from disk, with its preview
     full_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.file_path)
     if os.path.exists(full_path):
+        _remove_preview(full_path)
         os.remove(full_path)
         
     db.session.delete(file)
@@ -255,138 +616,60 @@ def delete_file(file_id):
 
 
 # --- Invoices ---
+def _invoice_cache():
+    from invoices import InvoiceCache
+    return InvoiceCache(current_app.config['INVOICE_CACHE_DIR'],
+                        current_app.config['INVOICE_CACHE_MAX_BYTES'])
+
 @main_bp.route('/api/payments/<int:id>/invoice', methods=['GET'])
 @login_required
 def download_invoice(id):
-    import qrcode
-    from fpdf import FPDF
-    import tempfile
+    from invoices import invoice_fields, render_invoice
     from flask import send_file
+    import io
 
     payment = Payment.query.get_or_404(id)
     sub = Subscription.query.get(payment.subscription_id)
     player = Player.query.get(sub.player_id)
 
-    # Generate QR Code
-    qr_data = f"Invoice:{payment.invoice_number}\nAmount:{payment.paid_amount}\nPlayer:{player.full_name}\nDate:{payment.payment_date}"
-    qr = qrcode.make(qr_data)
-    qr_path = os.path.join(tempfile.gettempdir(), f"qr_{id}.png")
-    qr.save(qr_path)
-
-    # Custom PDF Class
-    class InvoicePDF(FPDF):
-        def header(self):
-            # Logo Text
-            self.set_font('Arial', 'B', 24)
-            self.set_text_color(0, 255, 136) # Neon Green
-            self.cell(0, 15, 'Boshkash Academy', 0, 1, 'L')
-            
-            # Subheader
-            self.set_font('Arial', '', 10)
-            self.set_text_color(150, 150, 150)
-            self.cell(0, 5, 'Professional Football Training', 0, 1, 'L')
-            
-            # Line break
-            self.ln(10)
-            
-            # Invoice Title (Right aligned)
-            self.set_y(10)
-            self.set_font('Arial', 'B', 30)
-            self.set_text_color(220, 220, 220)
-            self.cell(0, 15, 'INVOICE', 0, 1, 'R')
-
-        def footer(self):
-            self.set_y(-15)
-            self.set_font('Arial', 'I', 8)
-            self.set_text_color(128)
-            self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
-
-    # Create PDF
-    pdf = InvoicePDF()
-    pdf.add_page()
-    pdf.set_auto_page_break(auto=True, margin=15)
-
-    # Colors
-    bg_color = (245, 245, 245)
-    header_color = (30, 41, 59) # Dark Blue
-    text_color = (30, 30, 30)
-
-    # --- Invoice Info Block ---
-    pdf.set_fill_color(*bg_color)
-    pdf.rect(10, 35, 190, 40, 'F')
-    
-    pdf.set_y(40)
-    pdf.set_font("Arial", 'B', 10)
-    pdf.set_text_color(100, 100, 100)
-    
-    # Left Column (Bill To)
-    pdf.set_x(15)
-    pdf.cell(40, 5, "BILL TO:", 0, 1)
-    pdf.set_font("Arial", 'B', 14)
-    pdf.set_text_color(*text_color)
-    pdf.set_x(15)
-    pdf.cell(40, 8, player.full_name, 0, 1)
-    pdf.set_font("Arial", '', 10)
-    pdf.set_x(15)
-    pdf.cell(40, 5, f"Team: {player.team or 'N/A'}", 0, 1)
-
-    # Right Column (Invoice Details)
-    # Re-position for right column
-    pdf.set_y(40)
-    pdf.set_x(120)
-    pdf.set_font("Arial", 'B', 10)
-    pdf.set_text_color(100, 100, 100)
-    pdf.cell(30, 5, "Invoice #:", 0, 0)
-    pdf.set_font("Arial", '', 10)
-    pdf.set_text_color(*text_color)
-    pdf.cell(40, 5, payment.invoice_number, 0, 1, 'R')
-    
-    pdf.set_x(120)
-    pdf.set_font("Arial", 'B', 10)
-    pdf.set_text_color(100, 100, 100)
-    pdf.cell(30, 5, "Date:", 0, 0)
-    pdf.set_font("Arial", '', 10)
-    pdf.set_text_color(*text_color)
-    pdf.cell(40, 5, payment.payment_date.strftime('%Y-%m-%d'), 0, 1, 'R')
-    
-    pdf.ln(20)
-
-    # --- Table Header ---
-    pdf.set_fill_color(*header_color)
-    pdf.set_text_color(255, 255, 255)
-    pdf.set_font("Arial", 'B', 11)
-    pdf.cell(110, 10, "  Description", 0, 0, 'L', 1)
-    pdf.cell(40, 10, "Type", 0, 0, 'C', 1)
-    pdf.cell(40, 10, "Amount  ", 0, 1, 'R', 1)
-
-    # --- Table Rows ---
-    pdf.set_text_color(*text_color)
-    pdf.set_font("Arial", '', 11)
-    
-    pdf.cell(110, 12, f"  Subscription Fee ({sub.start_date.strftime('%b %Y')})", "B", 0, 'L')
-    pdf.cell(40, 12, sub.type, "B", 0, 'C')
-    pdf.cell(40, 12, f"{payment.paid_amount:.2f}  ", "B", 1, 'R')
-
-    # --- Total ---
-    pdf.ln(5)
-    pdf.set_font("Arial", 'B', 14)
-    pdf.cell(150, 12, "Total Paid", 0, 0, 'R')
-    pdf.set_text_color(0, 128, 0) # Green
-    pdf.cell(40, 12, f"${payment.paid_amount:.2f}  ", 0, 1, 'R')
-
-    # --- QR Code & Footer Note ---
-    pdf.ln(10)
-    pdf.image(qr_path, x=15, y=pdf.get_y(), w=30)
-    
-    pdf.set_y(pdf.get_y() + 10)
-    pdf.set_x(50)
-    pdf.set_font("Arial", 'I', 9)
-    pdf.set_text_color(100, 100, 100)
-    pdf.multi_cell(0, 5, "Thank you for your business. This is a computer generated invoice and requires no signature.")
+    cache = _invoice_cache()
+    fields = invoice_fields(payment, sub, player)
+    download_name = f"Invoice_{payment.invoice_number}.pdf"
 
-    # Output
-    pdf_path = os.path.join(tempfile.gettempdir(), f"invoice_{id}.pdf")
-    pdf.output(pdf_path)
+    pdf_path = cache.get(fields)
+    if pdf_path:
+        return send_file(pdf_path, as_attachment=True, download_name=download_name)
 
-    return send_file(pdf_path, as_attachment=True, download_name=f"Invoice_{payment.invoice_number}.pdf")
+    pdf_bytes = render_invoice(fields)
+    cache.put(fields, pdf_bytes)
+    return send_file(io.BytesIO(pdf_bytes), mimetype='application/pdf',
+                     as_attachment=True, download_name=download_name)
 
+@main_bp.route('/api/invoices/export', methods=['GET'])
+@login_required
+def export_invoices():
+    """Stream a ZIP of every invoice with a payment date in [start, end]."""
+    from invoices import invoice_fields, iter_invoice_zip
+    from flask import Response
+
+    try:
+        start = datetime.fromisoformat(request.args['start'])
+        end = datetime.fromisoformat(request.args['end'])
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'message': 'start and end dates (YYYY-MM-DD) are required'}), 400
+    if len(request.args['end']) == 10:
+        # A bare end date includes the whole day
+        end = end.replace(hour=23, minute=59, second=59, microsecond=999999)
+
+    rows = db.session.query(Payment, Subscription, Player) \
+        .join(Subscription, Payment.subscription_id == Subscription.id) \
+        .join(Player, Subscription.player_id == Player.id) \
+        .filter(Payment.payment_date >= start, Payment.payment_date <= end) \
+        .order_by(Payment.payment_date) \
+        .all()
+    fields_list = [invoice_fields(payment, sub, player) for payment, sub, player in rows]
+
+    stream = iter_invoice_zip(fields_list, _invoice_cache(), current_app.config['INVOICE_WORKERS'])
+    filename = f"Invoices_{start:%Y-%m-%d}_{end:%Y-%m-%d}.zip"
+    return Response(stream, mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
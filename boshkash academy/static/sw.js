@@ -1,8 +1,108 @@
+// Bump VERSION whenever the app shell changes; old caches are dropped on activate.
+const VERSION = 'v1';
+const SHELL_CACHE = `boshkash-shell-${VERSION}`;
+const API_CACHE = `boshkash-api-${VERSION}`;
+
+const SHELL_URLS = [
+    '/dashboard',
+    '/login',
+    '/static/css/style.css',
+    '/static/manifest.json',
+    'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css',
+    'https://unpkg.com/tabulator-tables/dist/css/tabulator_midnight.min.css',
+    'https://unpkg.com/tabulator-tables/dist/js/tabulator.min.js'
+];
+
+// List endpoints served stale-while-revalidate; downloads and exports are not cached
+const API_LIST_PATTERNS = [
+    /^\/api\/players$/,
+    /^\/api\/subscriptions$/,
+    /^\/api\/players\/\d+\/files$/,
+    /^\/api\/dashboard\/stats$/
+];
+
 self.addEventListener('install', (e) => {
-    console.log('Service Worker: Installed');
+    e.waitUntil(
+        caches.open(SHELL_CACHE)
+            .then(cache => Promise.all(SHELL_URLS.map(url =>
+                fetch(url, { credentials: 'same-origin' })
+                    .then(response => {
+                        // Skip login redirects (e.g. /dashboard before sign-in)
+                        if (response.ok && !response.redirected) return cache.put(url, response);
+                    })
+                    // One unreachable CDN file must not block install
+                    .catch(() => null)
+            )))
+            .then(() => self.skipWaiting())
+    );
 });
 
+self.addEventListener('activate', (e) => {
+    e.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(
+                keys.filter(key => key.startsWith('boshkash-') && key !== SHELL_CACHE && key !== API_CACHE)
+                    .map(key => caches.delete(key))
+            ))
+            .then(() => self.clients.claim())
+    );
+});
+
+function staleWhileRevalidate(request) {
+    return caches.open(API_CACHE).then(cache =>
+        cache.match(request).then(cached => {
+            const network = fetch(request).then(response => {
+                if (response.ok) cache.put(request, response.clone());
+                return response;
+            });
+            if (cached) {
+                network.catch(() => null);
+                return cached;
+            }
+            return network;
+        })
+    );
+}
+
+function networkFirst(request) {
+    return fetch(request)
+        .then(response => {
+            if (response.ok && !response.redirected) {
+                const copy = response.clone();
+                caches.open(SHELL_CACHE).then(cache => cache.put(request, copy));
+            }
+            return response;
+        })
+        .catch(() => caches.match(request, { ignoreSearch: true }));
+}
+
 self.addEventListener('fetch', (e) => {
-    // Simple pass-through for now
-    e.respondWith(fetch(e.request));
+    const request = e.request;
+    const url = new URL(request.url);
+    const sameOrigin = url.origin === self.location.origin;
+
+    if (request.method !== 'GET') {
+        // Any write (or logout) makes cached API lists stale
+        if (sameOrigin && url.pathname.startsWith('/api/')) {
+            e.respondWith(caches.delete(API_CACHE).then(() => fetch(request)));
+        }
+        return;
+    }
+
+    if (sameOrigin && url.pathname.startsWith('/api/')) {
+        if (API_LIST_PATTERNS.some(p => p.test(url.pathname))) {
+            e.respondWith(staleWhileRevalidate(request));
+        }
+        return;
+    }
+
+    if (request.mode === 'navigate') {
+        e.respondWith(networkFirst(request));
+        return;
+    }
+
+    // Shell assets: cache first, fall back to network
+    e.respondWith(
+        caches.match(request).then(cached => cached || fetch(request))
+    );
 });
@@ -0,0 +1,111 @@
+"""Query-count and query-plan regression checks.
+
+Runs against a throwaway SQLite database and fails if the number of SQL
+statements issued by GET /api/subscriptions grows with the number of rows,
+or if a hot query stops using its index.
+
+    python check_queries.py
+
+Set CHECK_DATABASE_URL to run against a scratch Postgres database instead.
+"""
+import os
+import sys
+import tempfile
+
+os.environ['DATABASE_URL'] = os.environ.get('CHECK_DATABASE_URL') or \
+    'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'check.db')
+
+from sqlalchemy import event
+from app import app
+from commands import bootstrap
+from models import db, Player, Subscription, Payment
+from datetime import date
+
+
+def seed(count):
+    for i in range(count):
+        player = Player(full_name=f'Player {i}', age=10)
+        db.session.add(player)
+        db.session.flush()
+        sub = Subscription(player_id=player.id, type='monthly', amount=100,
+                           start_date=date(2024, 1, 1), end_date=date(2024, 2, 1))
+        db.session.add(sub)
+        db.session.flush()
+        db.session.add(Payment(subscription_id=sub.id, paid_amount=40))
+        db.session.add(Payment(subscription_id=sub.id, paid_amount=60))
+    db.session.commit()
+
+
+def count_queries(client, url):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(url)
+        assert response.status_code == 200, response.status_code
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return len(statements)
+
+
+# Hot queries and the index each one must use
+HOT_QUERIES = [
+    ("SELECT * FROM subscriptions WHERE player_id = 1", 'ix_subscriptions_player_id'),
+    ("SELECT COUNT(*) FROM subscriptions WHERE status = 'active'", 'ix_subscriptions_status_end_date'),
+    ("SELECT * FROM payments WHERE subscription_id = 1", 'ix_payments_subscription_id'),
+    ("SELECT * FROM payments WHERE payment_date BETWEEN '2024-01-01' AND '2024-02-01'", 'ix_payments_payment_date'),
+    ("SELECT * FROM files WHERE player_id = 1", 'ix_files_player_id'),
+    ("SELECT * FROM audit_log ORDER BY timestamp DESC LIMIT 50", 'ix_audit_log_timestamp'),
+    ("SELECT * FROM revenue_daily WHERE month >= '2024-01'", 'ix_revenue_daily_month'),
+    ("SELECT id FROM subscriptions WHERE status = 'active' AND end_date < '2024-01-01'",
+     'ix_subscriptions_status_end_date'),
+]
+
+
+def check_query_plans():
+    failures = []
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            explain = 'EXPLAIN QUERY PLAN '
+        else:
+            # Tiny scratch tables would otherwise always be seq-scanned
+            explain = 'EXPLAIN '
+            db.session.execute(db.text('SET enable_seqscan = off'))
+        for sql, index in HOT_QUERIES:
+            plan = ' '.join(str(col) for row in db.session.execute(db.text(explain + sql)) for col in row)
+            status = 'ok  ' if index in plan else 'MISS'
+            print(f"{status} {index:34} {sql}")
+            if index not in plan:
+                failures.append(index)
+    return failures
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        bootstrap()
+    client = app.test_client()
+    client.post('/api/login', json={'username': 'admin', 'password': 'admin122'})
+
+    counts = []
+    for batch in (5, 50):
+        with app.app_context():
+            seed(batch)
+        counts.append(count_queries(client, '/api/subscriptions'))
+
+    print(f"/api/subscriptions queries: {counts[0]} (5 rows) vs {counts[1]} (55 rows)")
+    failed = counts[1] > counts[0]
+    if failed:
+        print("FAIL: query count grows with row count")
+
+    if check_query_plans():
+        print("FAIL: hot queries not using their indexes")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+    print("OK")
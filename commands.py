@@ -0,0 +1,151 @@
+import logging
+import os
+import threading
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from werkzeug.security import generate_password_hash
+from models import db, User, recompute_subscription_balances, backfill_qr_payloads, rebuild_revenue_rollups, \
+    expire_subscriptions, backfill_file_blobs
+from migrations import run_migrations
+
+
+def bootstrap():
+    """Create the upload folder, tables, pending migrations and default admin."""
+    # Ensure upload directory exists (Ignore on read-only environments like Vercel)
+    try:
+        os.makedirs(current_app.config['UPLOAD_FOLDER'], exist_ok=True)
+    except OSError:
+        pass
+
+    db.create_all()
+    applied = run_migrations()
+    # Create default admin if not exists
+    if not User.query.filter_by(username='admin').first():
+        admin = User(
+            username='admin',
+            password_hash=generate_password_hash('admin122'),
+            role='admin'
+        )
+        db.session.add(admin)
+        db.session.commit()
+    return applied
+
+
+def sweep_expired_subscriptions():
+    """Expire ended subscriptions and drop this process's cached dashboard stats."""
+    from routes import invalidate_stats
+    count = expire_subscriptions()
+    db.session.commit()
+    if count:
+        invalidate_stats()
+    return count
+
+
+def start_expiry_timer(app, interval):
+    """Sweep now and then every ``interval`` seconds on a daemon thread.
+
+    For the desktop build, which has no cron; servers schedule the
+    expire-subscriptions command instead.
+    """
+    def run():
+        try:
+            with app.app_context():
+                sweep_expired_subscriptions()
+        except Exception:
+            logging.getLogger(__name__).exception("Subscription expiry sweep failed")
+        schedule(interval)
+
+    def schedule(delay):
+        timer = threading.Timer(delay, run)
+        timer.daemon = True
+        timer.start()
+
+    if interval > 0:
+        schedule(0)
+
+
+@click.command('init')
+@with_appcontext
+def init_command():
+    """One-shot setup to run on deploy before starting workers."""
+    bootstrap()
+    click.echo("Database initialised.")
+
+
+@click.command('repair-balances')
+@with_appcontext
+def repair_balances_command():
+    """Recompute stored paid totals and balances from the payments table."""
+    count = recompute_subscription_balances()
+    click.echo(f"Recomputed balances for {count} subscriptions.")
+
+
+@click.command('rebuild-revenue')
+@with_appcontext
+def rebuild_revenue_command():
+    """Recompute the revenue_daily rollup from subscriptions and payments."""
+    count = rebuild_revenue_rollups()
+    click.echo(f"Rebuilt {count} revenue rollup rows.")
+
+
+@click.command('expire-subscriptions')
+@with_appcontext
+def expire_subscriptions_command():
+    """Mark active subscriptions past their end date as expired."""
+    count = sweep_expired_subscriptions()
+    click.echo(f"Expired {count} subscriptions.")
+
+
+@click.command('backfill-qr')
+@click.option('--batch-size', default=500, show_default=True)
+@with_appcontext
+def backfill_qr_command(batch_size):
+    """Store invoice QR payloads for payments that predate them."""
+    count = backfill_qr_payloads(batch_size)
+    click.echo(f"Backfilled QR data for {count} payments.")
+
+
+@click.command('backfill-blobs')
+@click.option('--batch-size', default=100, show_default=True)
+@with_appcontext
+def backfill_blobs_command(batch_size):
+    """Move files uploaded before blob storage into BLOB_FOLDER."""
+    from blobstore import BlobStore
+    store = BlobStore(current_app.config['BLOB_FOLDER'])
+    moved, missing = backfill_file_blobs(store, current_app.config['UPLOAD_FOLDER'], batch_size)
+    click.echo(f"Moved {moved} files into blob storage.")
+    if missing:
+        click.echo(f"{missing} files are missing from disk and were left as they are.")
+
+
+@click.command('migrate')
+@with_appcontext
+def migrate_command():
+    """Apply pending schema migrations."""
+    applied = run_migrations()
+    for number, description in applied:
+        click.echo(f"Applied migration {number}: {description}")
+    if not applied:
+        click.echo("Schema is up to date.")
+
+
+@click.command('compress-static')
+@with_appcontext
+def compress_static_command():
+    """Write .gz/.br variants of static assets for precompressed serving."""
+    from compression import precompress_static
+    # User uploads live under static/ too; they are served as stored
+    written = precompress_static(current_app.static_folder, exclude=[current_app.config['UPLOAD_FOLDER']])
+    click.echo(f"Wrote {len(written)} precompressed files.")
+
+
+def register_commands(app):
+    app.cli.add_command(init_command)
+    app.cli.add_command(migrate_command)
+    app.cli.add_command(repair_balances_command)
+    app.cli.add_command(rebuild_revenue_command)
+    app.cli.add_command(expire_subscriptions_command)
+    app.cli.add_command(backfill_qr_command)
+    app.cli.add_command(backfill_blobs_command)
+    app.cli.add_command(compress_static_command)
@@ -0,0 +1,421 @@
+"""Invoice PDF rendering and the on-disk cache of rendered invoices.
+
+Rendering works from a plain dict of the fields printed on the invoice
+(see invoice_fields) so it can run without a database session.
+"""
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import qrcode
+from fpdf import FPDF
+
+from models import qr_payload
+
+# Bump when the layout changes so cached PDFs are re-rendered
+INVOICE_LAYOUT_VERSION = 1
+
+JOB_ID_RE = re.compile(r'^\d+-[0-9a-f]{32}$')
+# Seconds before a .pending marker is considered abandoned
+PENDING_TIMEOUT = 300
+
+
+class InvoicePDF(FPDF):
+    def header(self):
+        # Logo Text
+        self.set_font('Arial', 'B', 24)
+        self.set_text_color(0, 255, 136) # Neon Green
+        self.cell(0, 15, 'Boshkash Academy', 0, 1, 'L')
+
+        # Subheader
+        self.set_font('Arial', '', 10)
+        self.set_text_color(150, 150, 150)
+        self.cell(0, 5, 'Professional Football Training', 0, 1, 'L')
+
+        # Line break
+        self.ln(10)
+
+        # Invoice Title (Right aligned)
+        self.set_y(10)
+        self.set_font('Arial', 'B', 30)
+        self.set_text_color(220, 220, 220)
+        self.cell(0, 15, 'INVOICE', 0, 1, 'R')
+
+    def footer(self):
+        self.set_y(-15)
+        self.set_font('Arial', 'I', 8)
+        self.set_text_color(128)
+        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
+
+    def image_from_pil(self, key, img, x=None, y=None, w=0, h=0):
+        """Place a PIL image without a round-trip through disk.
+
+        fpdf 1.7 only loads images from a file path, so build the same
+        FlateDecode/PNG-predictor stream its PNG parser would produce.
+        """
+        if key not in self.images:
+            if img.mode not in ('1', 'L'):
+                img = img.convert('L')
+            width, height = img.size
+            bpc = 1 if img.mode == '1' else 8
+            stride = (width * bpc + 7) // 8
+            raw = img.tobytes()
+            # Prefix every row with PNG filter type 0 (None) for /Predictor 15
+            rows = b''.join(b'\x00' + raw[i * stride:(i + 1) * stride] for i in range(height))
+            self.images[key] = {
+                'i': len(self.images) + 1,
+                'w': width, 'h': height, 'cs': 'DeviceGray', 'bpc': bpc,
+                'f': 'FlateDecode',
+                'dp': f'/Predictor 15 /Colors 1 /BitsPerComponent {bpc} /Columns {width}',
+                'pal': '', 'trns': '',
+                'data': zlib.compress(rows),
+            }
+        self.image(key, x, y, w, h)
+
+
+
+def invoice_fields(payment, sub, player):
+    """Collect everything that appears on the invoice for a payment."""
+    return {
+        'payment_id': payment.id,
+        'invoice_number': payment.invoice_number,
+        'paid_amount': payment.paid_amount,
+        'payment_date': payment.payment_date,
+        'player_name': player.full_name,
+        'team': player.team,
+        'sub_type': sub.type,
+        'start_date': sub.start_date,
+        'qr_data': payment.qr_code_data or qr_payload(payment.invoice_number, payment.paid_amount,
+                                                      player.full_name, payment.payment_date),
+    }
+
+
+def invoice_digest(fields):
+    payload = json.dumps([INVOICE_LAYOUT_VERSION, fields], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def render_invoice(fields):
+    """Render the invoice PDF for ``fields`` and return it as bytes."""
+    qr = qrcode.make(fields['qr_data']).get_image()
+
+    # Create PDF
+    pdf = InvoicePDF()
+    pdf.add_page()
+    pdf.set_auto_page_break(auto=True, margin=15)
+
+    # Colors
+    bg_color = (245, 245, 245)
+    header_color = (30, 41, 59) # Dark Blue
+    text_color = (30, 30, 30)
+
+    # --- Invoice Info Block ---
+    pdf.set_fill_color(*bg_color)
+    pdf.rect(10, 35, 190, 40, 'F')
+    
+    pdf.set_y(40)
+    pdf.set_font("Arial", 'B', 10)
+    pdf.set_text_color(100, 100, 100)
+    
+    # Left Column (Bill To)
+    pdf.set_x(15)
+    pdf.cell(40, 5, "BILL TO:", 0, 1)
+    pdf.set_font("Arial", 'B', 14)
+    pdf.set_text_color(*text_color)
+    pdf.set_x(15)
+    pdf.cell(40, 8, fields['player_name'], 0, 1)
+    pdf.set_font("Arial", '', 10)
+    pdf.set_x(15)
+    pdf.cell(40, 5, f"Team: {fields['team'] or 'N/A'}", 0, 1)
+
+    # Right Column (Invoice Details)
+    # Re-position for right column
+    pdf.set_y(40)
+    pdf.set_x(120)
+    pdf.set_font("Arial", 'B', 10)
+    pdf.set_text_color(100, 100, 100)
+    pdf.cell(30, 5, "Invoice #:", 0, 0)
+    pdf.set_font("Arial", '', 10)
+    pdf.set_text_color(*text_color)
+    pdf.cell(40, 5, fields['invoice_number'], 0, 1, 'R')
+    
+    pdf.set_x(120)
+    pdf.set_font("Arial", 'B', 10)
+    pdf.set_text_color(100, 100, 100)
+    pdf.cell(30, 5, "Date:", 0, 0)
+    pdf.set_font("Arial", '', 10)
+    pdf.set_text_color(*text_color)
+    pdf.cell(40, 5, fields['payment_date'].strftime('%Y-%m-%d'), 0, 1, 'R')
+    
+    pdf.ln(20)
+
+    # --- Table Header ---
+    pdf.set_fill_color(*header_color)
+    pdf.set_text_color(255, 255, 255)
+    pdf.set_font("Arial", 'B', 11)
+    pdf.cell(110, 10, "  Description", 0, 0, 'L', 1)
+    pdf.cell(40, 10, "Type", 0, 0, 'C', 1)
+    pdf.cell(40, 10, "Amount  ", 0, 1, 'R', 1)
+
+    # --- Table Rows ---
+    pdf.set_text_color(*text_color)
+    pdf.set_font("Arial", '', 11)
+    
+    pdf.cell(110, 12, f"  Subscription Fee ({fields['start_date'].strftime('%b %Y')})", "B", 0, 'L')
+    pdf.cell(40, 12, fields['sub_type'], "B", 0, 'C')
+    pdf.cell(40, 12, f"{fields['paid_amount']:.2f}  ", "B", 1, 'R')
+
+    # --- Total ---
+    pdf.ln(5)
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(150, 12, "Total Paid", 0, 0, 'R')
+    pdf.set_text_color(0, 128, 0) # Green
+    pdf.cell(40, 12, f"${fields['paid_amount']:.2f}  ", 0, 1, 'R')
+
+    # --- QR Code & Footer Note ---
+    pdf.ln(10)
+    pdf.image_from_pil('qr', qr, x=15, y=pdf.get_y(), w=30)
+    
+    pdf.set_y(pdf.get_y() + 10)
+    pdf.set_x(50)
+    pdf.set_font("Arial", 'I', 9)
+    pdf.set_text_color(100, 100, 100)
+    pdf.multi_cell(0, 5, "Thank you for your business. This is a computer generated invoice and requires no signature.")
+
+    # fpdf 1.7 builds the document as a latin-1 str
+    return pdf.output(dest='S').encode('latin-1')
+
+
+class InvoiceCache:
+    """Size-bounded directory of rendered invoices with LRU eviction.
+
+    Entries are named ``<payment id>-<digest>.pdf`` so an edit to any printed
+    field produces a new entry; file mtimes track recency of use.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key_for(self, fields):
+        return f"{fields['payment_id']}-{invoice_digest(fields)[:32]}"
+
+    def path_for(self, fields):
+        return os.path.join(self.directory, self.key_for(fields) + '.pdf')
+
+    def get(self, fields):
+        """Return the cached PDF path for ``fields``, or None on a miss."""
+        path = self.path_for(fields)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, fields, pdf_bytes):
+        """Store rendered bytes; best effort, e.g. on read-only hosts."""
+        try:
+            self._write(self.path_for(fields), pdf_bytes)
+            self._evict()
+            return True
+        except OSError:
+            return False
+
+    def _write(self, path, data):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    # Background jobs are tracked on disk next to the cache entries
+    # (<key>.pending / <key>.failed) so any web worker can answer a poll.
+
+    def job_status(self, job_id):
+        """Return 'done', 'failed', 'pending' or None for an unknown job."""
+        if not JOB_ID_RE.match(job_id):
+            return None
+        base = os.path.join(self.directory, job_id)
+        for suffix, status in (('.pdf', 'done'), ('.failed', 'failed'), ('.pending', 'pending')):
+            if os.path.exists(base + suffix):
+                return status
+        return None
+
+    def job_result(self, job_id):
+        if self.job_status(job_id) != 'done':
+            return None
+        return os.path.join(self.directory, job_id + '.pdf')
+
+    def submit(self, fields, max_workers):
+        """Queue a render on the local process pool and return the job id."""
+        job_id = self.key_for(fields)
+        base = os.path.join(self.directory, job_id)
+        if self.job_status(job_id) == 'done':
+            return job_id
+        # A marker older than the timeout belongs to a render that died
+        try:
+            if time.time() - os.path.getmtime(base + '.pending') < PENDING_TIMEOUT:
+                return job_id
+        except FileNotFoundError:
+            pass
+
+        if os.path.exists(base + '.failed'):
+            os.remove(base + '.failed')
+        self._write(base + '.pending', b'')
+        try:
+            future = _submit(max_workers, render_job, self.directory, self.max_bytes, fields)
+        except Exception:
+            # Nothing was queued; don't let the marker claim otherwise
+            os.remove(base + '.pending')
+            raise
+        future.add_done_callback(lambda f: self._job_died(f, base))
+        return job_id
+
+    def _job_died(self, future, base):
+        """render_job() records its own errors, so a raising future lost its worker process."""
+        error = future.exception()
+        if error is None:
+            return
+        self._write(base + '.failed', f"Render process died: {error!r}".encode('utf-8'))
+        if os.path.exists(base + '.pending'):
+            os.remove(base + '.pending')
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.pdf'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        # Oldest first; always keep the most recent entry
+        for mtime, size, name in sorted(entries)[:-1]:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def render_job(directory, max_bytes, fields):
+    """Pool entry point: render ``fields`` into the cache and clear the marker."""
+    cache = InvoiceCache(directory, max_bytes)
+    base = os.path.join(directory, cache.key_for(fields))
+    try:
+        cache._write(base + '.pdf', render_invoice(fields))
+        cache._evict()
+    except Exception as e:
+        cache._write(base + '.failed', str(e).encode('utf-8'))
+    finally:
+        if os.path.exists(base + '.pending'):
+            os.remove(base + '.pending')
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _submit(max_workers, fn, *args):
+    """Run ``fn`` on the shared process pool and return its future.
+
+    A worker that dies (OOM kill, segfault) breaks the whole pool, so a
+    broken pool is replaced and the submit retried once.
+    """
+    global _executor
+    for attempt in range(2):
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=max_workers)
+            executor = _executor
+        try:
+            return executor.submit(fn, *args)
+        except BrokenProcessPool:
+            with _executor_lock:
+                if _executor is executor:
+                    _executor = None
+            if attempt:
+                raise
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable buffer that zipfile streams into."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_invoice_zip(fields_list, cache, max_workers):
+    """Yield a ZIP of the invoices in ``fields_list`` chunk by chunk.
+
+    Cached PDFs are added straight away; the rest are rendered on the
+    process pool and written as each one finishes, keeping at most a few
+    renders per worker in flight. An invoice that fails to render is left
+    out and listed in an ``errors.txt`` entry, since the response is already
+    under way by then.
+    """
+    sink = _ChunkSink()
+    # PDFs are already compressed, so store entries as-is
+    archive = zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED)
+    pending = {}
+    failed = []
+
+    def add(fields, pdf_bytes):
+        archive.writestr(f"Invoice_{fields['invoice_number']}.pdf", pdf_bytes)
+
+    def collect():
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            fields = pending.pop(future)
+            try:
+                pdf_bytes = future.result()
+            except Exception as e:
+                failed.append(f"{fields['invoice_number']}: {e}")
+                continue
+            cache.put(fields, pdf_bytes)
+            add(fields, pdf_bytes)
+
+    for fields in fields_list:
+        path = cache.get(fields)
+        if path:
+            with open(path, 'rb') as f:
+                add(fields, f.read())
+        else:
+            pending[_submit(max_workers, render_invoice, fields)] = fields
+            if len(pending) >= max_workers * 4:
+                collect()
+        yield sink.drain()
+
+    while pending:
+        collect()
+        yield sink.drain()
+
+    if failed:
+        archive.writestr('errors.txt', "These invoices could not be rendered:\n" + '\n'.join(failed) + '\n')
+    archive.close()
+    yield sink.drain()
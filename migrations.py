@@ -0,0 +1,104 @@
+"""Small versioned schema migrations for existing databases.
+
+db.create_all() only creates missing tables, so columns and indexes added to
+models.py after a database was first created are applied here. Each
+migration runs once, in order, and is recorded in the schema_version table.
+Migrations are written to be idempotent so they are also safe on a fresh
+database that create_all() has already brought up to date. A migration may
+return a callable to run after its DDL has committed (e.g. a data backfill).
+"""
+from sqlalchemy import inspect, text
+
+from models import db, Blob, RevenueDaily, recompute_subscription_balances, rebuild_revenue_rollups, VERSIONED_TABLES
+
+
+def _add_column(conn, table, column, ddl):
+    columns = {c['name'] for c in inspect(conn).get_columns(table)}
+    if column not in columns:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+        return True
+    return False
+
+
+def _create_index(conn, name, table, columns):
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+
+
+def m001_subscription_balances(conn):
+    added = _add_column(conn, 'subscriptions', 'paid_total', "FLOAT NOT NULL DEFAULT 0")
+    added = _add_column(conn, 'subscriptions', 'balance_due', "FLOAT NOT NULL DEFAULT 0") or added
+    if added:
+        return recompute_subscription_balances
+
+
+def m002_hot_path_indexes(conn):
+    _create_index(conn, 'ix_subscriptions_player_id', 'subscriptions', ['player_id'])
+    _create_index(conn, 'ix_subscriptions_status', 'subscriptions', ['status'])
+    _create_index(conn, 'ix_payments_subscription_id', 'payments', ['subscription_id'])
+    _create_index(conn, 'ix_payments_payment_date', 'payments', ['payment_date'])
+    _create_index(conn, 'ix_files_player_id', 'files', ['player_id'])
+    _create_index(conn, 'ix_audit_log_timestamp', 'audit_log', ['timestamp'])
+
+
+def m003_table_versions(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS table_versions "
+        "(name VARCHAR(50) NOT NULL PRIMARY KEY, version INTEGER NOT NULL)"
+    ))
+    existing = {row[0] for row in conn.execute(text("SELECT name FROM table_versions"))}
+    for name in VERSIONED_TABLES:
+        if name not in existing:
+            conn.execute(text("INSERT INTO table_versions (name, version) VALUES (:n, 0)"), {'n': name})
+
+
+def m004_file_blobs(conn):
+    Blob.__table__.create(conn, checkfirst=True)
+    _add_column(conn, 'files', 'blob_sha256', "VARCHAR(64) REFERENCES blobs (sha256)")
+    _add_column(conn, 'files', 'size', "INTEGER")
+    _create_index(conn, 'ix_files_blob_sha256', 'files', ['blob_sha256'])
+
+
+def m005_revenue_rollups(conn):
+    RevenueDaily.__table__.create(conn, checkfirst=True)
+    _create_index(conn, 'ix_revenue_daily_month', 'revenue_daily', ['month'])
+    return rebuild_revenue_rollups
+
+
+def m006_subscription_expiry_index(conn):
+    _create_index(conn, 'ix_subscriptions_status_end_date', 'subscriptions', ['status', 'end_date'])
+    # status is the composite's leading column, so it serves status-only filters too
+    conn.execute(text("DROP INDEX IF EXISTS ix_subscriptions_status"))
+
+
+MIGRATIONS = [
+    (1, 'stored subscription balances', m001_subscription_balances),
+    (2, 'indexes for hot queries', m002_hot_path_indexes),
+    (3, 'table change versions', m003_table_versions),
+    (4, 'content-addressed file blobs', m004_file_blobs),
+    (5, 'revenue rollups', m005_revenue_rollups),
+    (6, 'subscription expiry index', m006_subscription_expiry_index),
+]
+
+
+def current_version(conn):
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+
+def run_migrations():
+    """Apply pending migrations; returns the list of versions applied."""
+    applied = []
+    after_commit = []
+    with db.engine.begin() as conn:
+        version = current_version(conn)
+        for number, description, migrate in MIGRATIONS:
+            if number <= version:
+                continue
+            hook = migrate(conn)
+            if hook:
+                after_commit.append(hook)
+            conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {'v': number})
+            applied.append((number, description))
+    for hook in after_commit:
+        hook()
+    return applied
@@ -1,9 +1,24 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from datetime import datetime
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from datetime import date, datetime
+import os
 
 db = SQLAlchemy()
 
+def apply_sqlite_pragmas(engine, pragmas):
+    """Run ``PRAGMA key=value`` on every connection the engine opens."""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for key, value in pragmas.items():
+            cursor.execute(f"PRAGMA {key}={value}")
+        cursor.close()
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
@@ -51,22 +66,30 @@ class Player(db.Model):
 class Subscription(db.Model):
     __tablename__ = 'subscriptions'
     id = db.Column(db.Integer, primary_key=True)
-    player_id = db.Column(db.Integer, db.ForeignKey('players.id'), nullable=False)
+    player_id = db.Column(db.Integer, db.ForeignKey('players.id'), nullable=False, index=True)
     type = db.Column(db.String(20), nullable=False)  # monthly, yearly
     amount = db.Column(db.Float, nullable=False)
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date, nullable=False)
     status = db.Column(db.String(20), default='active')  # active, expired, pending
+    # Running totals kept in sync by the Payment listeners below
+    paid_total = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    balance_due = db.Column(db.Float, nullable=False, default=0, server_default='0')
 
     payments = db.relationship('Payment', backref='subscription', lazy=True)
 
+    __table_args__ = (
+        # Expiry sweep and "expiring soon": status = 'active' AND end_date in a range
+        db.Index('ix_subscriptions_status_end_date', 'status', 'end_date'),
+    )
+
     @property
     def total_paid(self):
-        return sum(p.paid_amount for p in self.payments)
+        return self.paid_total or 0
 
     @property
     def remaining_balance(self):
-        return self.amount - self.total_paid
+        return self.balance_due if self.balance_due is not None else self.amount
 
     def to_dict(self):
         return {
@@ -83,12 +106,29 @@ class Subscription(db.Model):
             'payments': [p.to_dict() for p in self.payments]
         }
 
+class RevenueDaily(db.Model):
+    """Billed and paid totals per day, subscription type and team.
+
+    Kept current by the Subscription and Payment listeners below so revenue
+    reports never scan payments; ``flask --app app rebuild-revenue`` recomputes
+    it. Subscriptions are billed on their start date, and the team is the
+    player's team when the row was written.
+    """
+    __tablename__ = 'revenue_daily'
+    day = db.Column(db.Date, primary_key=True)
+    subscription_type = db.Column(db.String(20), primary_key=True)
+    team = db.Column(db.String(50), primary_key=True)  # '' for players without a team
+    month = db.Column(db.String(7), nullable=False, index=True)  # "YYYY-MM", for portable GROUP BY
+    billed = db.Column(db.Float, nullable=False, default=0)
+    paid = db.Column(db.Float, nullable=False, default=0)
+    payment_count = db.Column(db.Integer, nullable=False, default=0)
+
 class Payment(db.Model):
     __tablename__ = 'payments'
     id = db.Column(db.Integer, primary_key=True)
-    subscription_id = db.Column(db.Integer, db.ForeignKey('subscriptions.id'), nullable=False)
+    subscription_id = db.Column(db.Integer, db.ForeignKey('subscriptions.id'), nullable=False, index=True)
     paid_amount = db.Column(db.Float, nullable=False)
-    payment_date = db.Column(db.DateTime, default=datetime.utcnow)
+    payment_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     payment_method = db.Column(db.String(50)) # cash, card, etc.
     invoice_number = db.Column(db.String(50), unique=True)
     qr_code_data = db.Column(db.Text)
@@ -104,13 +144,248 @@ class Payment(db.Model):
             'qr_code_data': self.qr_code_data
         }
 
+def qr_payload(invoice_number, paid_amount, player_name, payment_date):
+    """Text encoded in the invoice QR code."""
+    return f"Invoice:{invoice_number}\nAmount:{paid_amount}\nPlayer:{player_name}\nDate:{payment_date}"
+
+# Dialects whose INSERT supports ON CONFLICT DO UPDATE
+UPSERT_INSERT = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+def _upsert_add(connection, table, keys, deltas, **new_row):
+    """Add ``deltas`` to the row matching ``keys``, inserting it if missing.
+
+    ``new_row`` holds the other columns to set when the row is created.
+    """
+    increments = {name: table.c[name] + delta for name, delta in deltas.items()}
+    if connection.dialect.name in UPSERT_INSERT:
+        # A single statement, so two first writes of the same key can't both insert
+        connection.execute(
+            UPSERT_INSERT[connection.dialect.name](table)
+            .values(**keys, **deltas, **new_row)
+            .on_conflict_do_update(index_elements=list(keys), set_=increments)
+        )
+        return
+    updated = connection.execute(
+        table.update().where(*(table.c[name] == value for name, value in keys.items())).values(increments)
+    ).rowcount
+    if not updated:
+        connection.execute(table.insert().values(**keys, **deltas, **new_row))
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+def _adjust_revenue(connection, day, subscription_type, team, **deltas):
+    """Shift the revenue_daily row for one day/type/team inside the current transaction."""
+    if not any(deltas.values()):
+        return
+    day = _as_date(day)
+    _upsert_add(connection, RevenueDaily.__table__,
+                {'day': day, 'subscription_type': subscription_type or '', 'team': team or ''},
+                deltas, month=day.strftime('%Y-%m'))
+
+def _subscription_labels(connection, subscription_id):
+    """(type, team) a subscription's revenue is reported under."""
+    players = Player.__table__
+    subs = Subscription.__table__
+    row = connection.execute(
+        db.select(subs.c.type, players.c.team)
+        .select_from(subs.join(players, subs.c.player_id == players.c.id))
+        .where(subs.c.id == subscription_id)
+    ).first()
+    return tuple(row) if row else ('', '')
+
+def _previous(target, *names):
+    """Values of ``names`` as they were before the pending update."""
+    state = inspect(target)
+    values = []
+    for name in names:
+        history = state.attrs[name].history
+        values.append(history.deleted[0] if history.has_changes() and history.deleted else getattr(target, name))
+    return values
+
+def _adjust_paid_total(connection, subscription_id, delta):
+    """Shift a subscription's running totals inside the current transaction."""
+    if not delta:
+        return
+    table = Subscription.__table__
+    connection.execute(
+        table.update()
+        .where(table.c.id == subscription_id)
+        .values(paid_total=table.c.paid_total + delta,
+                balance_due=table.c.balance_due - delta)
+    )
+
+@event.listens_for(Subscription, 'before_insert')
+def _subscription_inserted(mapper, connection, target):
+    target.paid_total = target.paid_total or 0
+    target.balance_due = target.amount - target.paid_total
+
+@event.listens_for(Subscription, 'after_insert')
+def _subscription_billed(mapper, connection, target):
+    sub_type, team = _subscription_labels(connection, target.id)
+    _adjust_revenue(connection, target.start_date, sub_type, team, billed=target.amount)
+
+@event.listens_for(Subscription, 'after_update')
+def _subscription_rebilled(mapper, connection, target):
+    old_amount, old_start, old_type = _previous(target, 'amount', 'start_date', 'type')
+    if (old_amount, _as_date(old_start), old_type) == (target.amount, _as_date(target.start_date), target.type):
+        return
+    team = _subscription_labels(connection, target.id)[1]
+    _adjust_revenue(connection, old_start, old_type, team, billed=-old_amount)
+    _adjust_revenue(connection, target.start_date, target.type, team, billed=target.amount)
+
+@event.listens_for(Subscription, 'before_delete')
+def _subscription_unbilled(mapper, connection, target):
+    # before_delete: the player join still works
+    sub_type, team = _subscription_labels(connection, target.id)
+    _adjust_revenue(connection, target.start_date, sub_type, team, billed=-target.amount)
+
+@event.listens_for(Subscription, 'before_update')
+def _subscription_updated(mapper, connection, target):
+    if inspect(target).attrs.amount.history.has_changes():
+        # Computed in SQL so a stale in-memory paid_total can't leak in
+        target.balance_due = target.amount - Subscription.__table__.c.paid_total
+
+@event.listens_for(Payment, 'before_insert')
+def _payment_qr_data(mapper, connection, target):
+    # Fix the QR payload at issue time so invoice rendering never rebuilds it
+    if target.qr_code_data:
+        return
+    if target.payment_date is None:
+        target.payment_date = datetime.utcnow()
+    players = Player.__table__
+    subs = Subscription.__table__
+    player_name = connection.execute(
+        db.select(players.c.full_name)
+        .select_from(subs.join(players, subs.c.player_id == players.c.id))
+        .where(subs.c.id == target.subscription_id)
+    ).scalar()
+    target.qr_code_data = qr_payload(target.invoice_number, target.paid_amount,
+                                     player_name, target.payment_date)
+
+@event.listens_for(Payment, 'after_insert')
+def _payment_inserted(mapper, connection, target):
+    _adjust_paid_total(connection, target.subscription_id, target.paid_amount)
+    _adjust_revenue(connection, target.payment_date, *_subscription_labels(connection, target.subscription_id),
+                    paid=target.paid_amount, payment_count=1)
+
+@event.listens_for(Payment, 'after_update')
+def _payment_updated(mapper, connection, target):
+    history = inspect(target).attrs.paid_amount.history
+    if history.has_changes() and history.deleted:
+        _adjust_paid_total(connection, target.subscription_id,
+                           target.paid_amount - history.deleted[0])
+    old_amount, old_date = _previous(target, 'paid_amount', 'payment_date')
+    if (old_amount, old_date) != (target.paid_amount, target.payment_date):
+        labels = _subscription_labels(connection, target.subscription_id)
+        _adjust_revenue(connection, old_date, *labels, paid=-old_amount, payment_count=-1)
+        _adjust_revenue(connection, target.payment_date, *labels, paid=target.paid_amount, payment_count=1)
+
+@event.listens_for(Payment, 'after_delete')
+def _payment_deleted(mapper, connection, target):
+    _adjust_paid_total(connection, target.subscription_id, -target.paid_amount)
+    _adjust_revenue(connection, target.payment_date, *_subscription_labels(connection, target.subscription_id),
+                    paid=-target.paid_amount, payment_count=-1)
+
+def recompute_subscription_balances():
+    """Rebuild every subscription's running totals from payments in one UPDATE."""
+    payments = Payment.__table__
+    subs = Subscription.__table__
+    paid = db.select(db.func.coalesce(db.func.sum(payments.c.paid_amount), 0)) \
+        .where(payments.c.subscription_id == subs.c.id) \
+        .scalar_subquery()
+    result = db.session.execute(
+        subs.update().values(paid_total=paid, balance_due=subs.c.amount - paid)
+    )
+    db.session.commit()
+    return result.rowcount
+
+def expire_subscriptions(today=None):
+    """Mark active subscriptions that ended before ``today`` as expired.
+
+    One set-based UPDATE over the (status, end_date) index; returns the number
+    of subscriptions expired. Callers commit.
+    """
+    today = today or date.today()
+    subs = Subscription.__table__
+    result = db.session.execute(
+        subs.update()
+        .where(subs.c.status == 'active', subs.c.end_date < today)
+        .values(status='expired')
+    )
+    if result.rowcount:
+        bump_table_versions('subscriptions')
+    return result.rowcount
+
+def rebuild_revenue_rollups(batch_size=1000):
+    """Recompute revenue_daily from subscriptions and payments; returns the row count."""
+    totals = {}
+
+    def add(day, sub_type, team, billed=0, paid=0, count=0):
+        day = _as_date(day)
+        row = totals.setdefault((day, sub_type or '', team or ''), [0, 0, 0])
+        row[0] += billed
+        row[1] += paid
+        row[2] += count
+
+    subs = db.session.query(Subscription.start_date, Subscription.type, Subscription.amount, Player.team) \
+        .join(Player, Subscription.player_id == Player.id)
+    for start_date, sub_type, amount, team in subs.yield_per(batch_size):
+        add(start_date, sub_type, team, billed=amount)
+    payments = db.session.query(Payment.payment_date, Subscription.type, Player.team, Payment.paid_amount) \
+        .join(Subscription, Payment.subscription_id == Subscription.id) \
+        .join(Player, Subscription.player_id == Player.id)
+    for payment_date, sub_type, team, paid_amount in payments.yield_per(batch_size):
+        add(payment_date, sub_type, team, paid=paid_amount, count=1)
+
+    db.session.execute(RevenueDaily.__table__.delete())
+    rows = [{'day': day, 'subscription_type': sub_type, 'team': team, 'month': day.strftime('%Y-%m'),
+             'billed': billed, 'paid': paid, 'payment_count': count}
+            for (day, sub_type, team), (billed, paid, count) in totals.items()]
+    if rows:
+        db.session.execute(RevenueDaily.__table__.insert(), rows)
+    bump_table_versions('revenue_daily')
+    db.session.commit()
+    return len(rows)
+
+def backfill_qr_payloads(batch_size=500):
+    """Fill qr_code_data for payments created before it was stored."""
+    missing = db.or_(Payment.qr_code_data.is_(None), Payment.qr_code_data == '')
+    count = 0
+    while True:
+        rows = db.session.query(Payment, Player.full_name) \
+            .join(Subscription, Payment.subscription_id == Subscription.id) \
+            .join(Player, Subscription.player_id == Player.id) \
+            .filter(missing) \
+            .order_by(Payment.id) \
+            .limit(batch_size) \
+            .all()
+        if not rows:
+            return count
+        for payment, player_name in rows:
+            payment.qr_code_data = qr_payload(payment.invoice_number, payment.paid_amount,
+                                              player_name, payment.payment_date)
+        db.session.commit()
+        count += len(rows)
+
+class Blob(db.Model):
+    """A stored file body, shared by every File row with the same content."""
+    __tablename__ = 'blobs'
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class File(db.Model):
     __tablename__ = 'files'
     id = db.Column(db.Integer, primary_key=True)
-    player_id = db.Column(db.Integer, db.ForeignKey('players.id'), nullable=False)
+    player_id = db.Column(db.Integer, db.ForeignKey('players.id'), nullable=False, index=True)
+    # "player_id/filename"; a file on disk for rows without a blob, otherwise only the display name
     file_path = db.Column(db.String(255), nullable=False)
     file_type = db.Column(db.String(50))
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    blob_sha256 = db.Column(db.String(64), db.ForeignKey('blobs.sha256'), index=True)
+    size = db.Column(db.Integer)
 
     def to_dict(self):
         return {
@@ -118,15 +393,121 @@ class File(db.Model):
             'player_id': self.player_id,
             'file_path': self.file_path,
             'file_type': self.file_type,
-            'uploaded_at': self.uploaded_at.isoformat()
+            'uploaded_at': self.uploaded_at.isoformat(),
+            'sha256': self.blob_sha256,
+            'size': self.size
         }
 
+@event.listens_for(File, 'before_insert')
+def _file_inserted(mapper, connection, target):
+    if not target.blob_sha256:
+        return
+    _upsert_add(connection, Blob.__table__, {'sha256': target.blob_sha256}, {'ref_count': 1},
+                size=target.size, created_at=datetime.utcnow())
+
+@event.listens_for(File, 'after_delete')
+def _file_deleted(mapper, connection, target):
+    if not target.blob_sha256:
+        return
+    blobs = Blob.__table__
+    connection.execute(
+        blobs.update().where(blobs.c.sha256 == target.blob_sha256)
+        .values(ref_count=blobs.c.ref_count - 1)
+    )
+    deleted = connection.execute(
+        blobs.delete().where(blobs.c.sha256 == target.blob_sha256, blobs.c.ref_count <= 0)
+    ).rowcount
+    if deleted:
+        # The bytes go once the delete commits, see pop_released_blobs()
+        inspect(target).session.info.setdefault('released_blobs', set()).add(target.blob_sha256)
+
+def pop_released_blobs():
+    """Hashes whose last File reference was deleted in this session."""
+    return db.session.info.pop('released_blobs', set())
+
+def blob_exists(sha256):
+    """Whether a committed File row references the blob.
+
+    Asked on a connection of its own, so every call sees the latest commits
+    rather than the snapshot of the session's open transaction.
+    """
+    blobs = Blob.__table__
+    with db.engine.connect() as conn:
+        return conn.execute(blobs.select().where(blobs.c.sha256 == sha256)).first() is not None
+
+def backfill_file_blobs(store, upload_root, batch_size=100):
+    """Move files uploaded before blob storage into ``store``; returns (moved, missing).
+
+    Each batch is staged, committed and only then put in place, as for a new
+    upload. Originals are removed at the end, since rows that overwrote each
+    other's upload share one file.
+    """
+    moved = missing = 0
+    originals = set()
+    last_id = 0
+    while True:
+        files = File.query.filter(File.blob_sha256.is_(None), File.id > last_id) \
+            .order_by(File.id).limit(batch_size).all()
+        if not files:
+            break
+        last_id = files[-1].id
+        staged = []
+        for file in files:
+            original = os.path.join(upload_root, file.file_path)
+            try:
+                with open(original, 'rb') as f:
+                    tmp, sha256, size = store.stage_stream(f)
+            except FileNotFoundError:
+                missing += 1
+                continue
+            # Set directly, so count the reference the insert listener would have
+            _upsert_add(db.session.connection(), Blob.__table__, {'sha256': sha256}, {'ref_count': 1},
+                        size=size, created_at=datetime.utcnow())
+            file.blob_sha256, file.size = sha256, size
+            staged.append((tmp, sha256))
+            originals.add(original)
+        db.session.commit()
+        for tmp, sha256 in staged:
+            store.ingest(tmp, sha256)
+        moved += len(staged)
+    for original in originals:
+        try:
+            os.remove(original)
+        except OSError:
+            pass
+    return moved, missing
+
+class TableVersion(db.Model):
+    """Change counter per table, bumped by write routes; used for ETags."""
+    __tablename__ = 'table_versions'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+VERSIONED_TABLES = ('players', 'subscriptions', 'payments', 'files', 'revenue_daily')
+
+def bump_table_versions(*names):
+    """Increment the change counters in the current transaction."""
+    table = TableVersion.__table__
+    result = db.session.execute(
+        table.update().where(table.c.name.in_(names)).values(version=table.c.version + 1)
+    )
+    if result.rowcount < len(names):
+        # Counter rows are seeded by migration 3; recreate any that are missing
+        existing = set(db.session.scalars(db.select(table.c.name).where(table.c.name.in_(names))))
+        db.session.execute(table.insert(), [{'name': n, 'version': 1} for n in names if n not in existing])
+
+def get_table_versions(*names):
+    rows = db.session.query(TableVersion.name, TableVersion.version) \
+        .filter(TableVersion.name.in_(names)).all()
+    versions = dict(rows)
+    return [versions.get(name, 0) for name in names]
+
 class AuditLog(db.Model):
     __tablename__ = 'audit_log'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     action = db.Column(db.String(255), nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     def to_dict(self):
         return {
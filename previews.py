@@ -0,0 +1,177 @@
+"""Thumbnails of uploaded images and first-page previews of PDFs.
+
+Previews are rendered off-request on a local process pool and cached as
+``<sha256>-<size>.jpg`` keyed by the blob they were made from, so identical
+uploads share one preview and a cached preview never goes stale. As with
+invoice jobs, state is kept on disk (``.pending`` while rendering, ``.none``
+when no preview can be made) so any web worker can answer.
+"""
+import glob
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, ImageOps
+
+try:
+    import fitz  # PyMuPDF, optional: renders PDF pages without external tools
+    HAS_PYMUPDF = True
+except ImportError:
+    HAS_PYMUPDF = False
+
+IMAGE_TYPES = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'bmp', 'tif', 'tiff'}
+PREVIEW_TYPES = IMAGE_TYPES | {'pdf'}
+# Seconds before a .pending marker is considered abandoned
+PENDING_TIMEOUT = 120
+
+
+def _pdf_first_page(src_path, size):
+    """First page of a PDF as a PIL image, or None without a renderer."""
+    if HAS_PYMUPDF:
+        with fitz.open(src_path) as doc:
+            page = doc[0]
+            zoom = size / max(page.rect.width, page.rect.height)
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+            return Image.frombytes('RGB', (pix.width, pix.height), pix.samples)
+    if shutil.which('pdftoppm'):
+        out = subprocess.run(['pdftoppm', '-png', '-f', '1', '-l', '1', '-scale-to', str(size), src_path],
+                             capture_output=True, timeout=60, check=True).stdout
+        return Image.open(io.BytesIO(out))
+    return None
+
+
+def render_preview(src_path, file_type, size):
+    """JPEG bytes of a preview fitting in ``size`` x ``size``, or None."""
+    if file_type == 'pdf':
+        img = _pdf_first_page(src_path, size)
+        if img is None:
+            return None
+    else:
+        img = Image.open(src_path)
+        # Let the JPEG decoder downscale while reading instead of decoding full size
+        img.draft('RGB', (size, size))
+        img = ImageOps.exif_transpose(img)
+    img.thumbnail((size, size))
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+        img = background
+    buf = io.BytesIO()
+    img.save(buf, 'JPEG', quality=80, optimize=True)
+    return buf.getvalue()
+
+
+class PreviewCache:
+    def __init__(self, directory, size):
+        self.directory = directory
+        self.size = size
+
+    def _base(self, sha256):
+        return os.path.join(self.directory, sha256[:2], f"{sha256}-{self.size}")
+
+    def path_for(self, sha256):
+        return self._base(sha256) + '.jpg'
+
+    def status(self, sha256):
+        """Return 'done', 'none', 'pending' or None if never requested."""
+        base = self._base(sha256)
+        for suffix, status in (('.jpg', 'done'), ('.none', 'none')):
+            if os.path.exists(base + suffix):
+                return status
+        try:
+            if time.time() - os.path.getmtime(base + '.pending') < PENDING_TIMEOUT:
+                return 'pending'
+        except FileNotFoundError:
+            pass
+        return None
+
+    def submit(self, src_path, sha256, file_type, max_workers):
+        """Queue a render unless one is cached or already running; returns the status."""
+        status = self.status(sha256)
+        if status:
+            return status
+        base = self._base(sha256)
+        _write(base + '.pending', b'')
+        try:
+            future = _submit(max_workers, preview_job, self.directory, self.size, src_path, sha256, file_type)
+        except Exception:
+            # Nothing was queued; don't let the marker claim otherwise
+            os.remove(base + '.pending')
+            raise
+        future.add_done_callback(lambda f: _job_died(f, base))
+        return 'pending'
+
+    def remove(self, sha256):
+        """Drop every cached preview of ``sha256``, at any size, and its markers."""
+        pattern = glob.escape(os.path.join(self.directory, sha256[:2], sha256)) + '-*'
+        for path in glob.glob(pattern):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def preview_job(directory, size, src_path, sha256, file_type):
+    """Pool entry point: render one preview into the cache and clear the marker."""
+    cache = PreviewCache(directory, size)
+    base = cache._base(sha256)
+    try:
+        data = render_preview(src_path, file_type, size)
+        # Unreadable or unsupported files get a .none marker so they aren't retried
+        _write(base + ('.jpg' if data else '.none'), data or b'')
+    except Exception as e:
+        _write(base + '.none', str(e).encode('utf-8'))
+    finally:
+        if not os.path.exists(src_path):
+            # Deleted while rendering; keep nothing derived from it
+            cache.remove(sha256)
+        elif os.path.exists(base + '.pending'):
+            os.remove(base + '.pending')
+
+
+def _job_died(future, base):
+    """preview_job() records its own errors, so a raising future lost its worker process."""
+    # Every job queued on a broken pool fails with it, not only the one that
+    # crashed, so clear the marker and let the next request try again
+    if future.exception() is not None and os.path.exists(base + '.pending'):
+        os.remove(base + '.pending')
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _submit(max_workers, fn, *args):
+    """Run ``fn`` on the shared process pool and return its future.
+
+    A worker that dies (OOM kill, segfault) breaks the whole pool, so a
+    broken pool is replaced and the submit retried once.
+    """
+    global _executor
+    for attempt in range(2):
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=max_workers)
+            executor = _executor
+        try:
+            return executor.submit(fn, *args)
+        except BrokenProcessPool:
+            with _executor_lock:
+                if _executor is executor:
+                    _executor = None
+            if attempt:
+                raise
@@ -1,12 +1,51 @@
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, current_app
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
-from models import db, User, Player, Subscription, Payment, File, AuditLog
+from models import db, User, Player, Subscription, Payment, File, AuditLog, RevenueDaily, bump_table_versions, \
+    get_table_versions, pop_released_blobs, blob_exists
+from sqlalchemy.orm import joinedload, selectinload
+from uploads import UploadError, UploadStore
 from datetime import datetime
+from functools import wraps
+import hashlib
 import os
+import time
 
 main_bp = Blueprint('main', __name__)
 
+# Per-process cache for /api/dashboard/stats; cleared by the write routes and
+# expired after STATS_CACHE_TTL so other gunicorn workers catch up
+_stats_cache = {'data': None, 'expires_at': 0}
+
+def invalidate_stats():
+    _stats_cache['data'] = None
+
+def conditional_list(*tables):
+    """Serve a GET list with an ETag derived from the tables' change versions.
+
+    A matching If-None-Match is answered with 304 after reading only the
+    version counters, never the rows themselves.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = get_table_versions(*tables)
+            key = f"{request.path}?{request.query_string.decode()}|{versions}"
+            etag = hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+            # Weak match: compressed responses carry a weak ETag (see compression.py)
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            # Always revalidate; the 304 path is cheap
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
 # --- View Routes ---
 
 @main_bp.route('/')
@@ -26,6 +65,14 @@ def login_page():
 def dashboard():
     return render_template('dashboard.html', user=current_user)
 
+@main_bp.route('/sw.js')
+def service_worker():
+    # Served from the root so the worker's scope covers /dashboard and /api/*
+    from flask import send_from_directory
+    response = send_from_directory(current_app.static_folder, 'sw.js', mimetype='application/javascript')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 # --- API Routes ---
 
 @main_bp.route('/api/login', methods=['POST'])
@@ -49,11 +96,74 @@ def api_logout():
 
 # --- Player Management ---
 
+PLAYER_SORT_FIELDS = ('id', 'full_name', 'age', 'position', 'team', 'created_at')
+PLAYER_FILTER_FIELDS = ('full_name', 'position', 'team', 'phone', 'parent_name')
+MAX_PAGE_SIZE = 500
+
+def _filter_players(query, args):
+    """Apply team/position/age filters from the query string.
+
+    Accepts plain params (?team=U12&min_age=8&max_age=12) as well as
+    Tabulator's remote filter array (filter[0][field]=team&filter[0][value]=U12).
+    """
+    if args.get('team'):
+        query = query.filter(Player.team == args['team'])
+    if args.get('position'):
+        query = query.filter(Player.position == args['position'])
+    if args.get('min_age', type=int) is not None:
+        query = query.filter(Player.age >= args.get('min_age', type=int))
+    if args.get('max_age', type=int) is not None:
+        query = query.filter(Player.age <= args.get('max_age', type=int))
+
+    i = 0
+    while f'filter[{i}][field]' in args:
+        field = args.get(f'filter[{i}][field]')
+        value = args.get(f'filter[{i}][value]', '')
+        if field in PLAYER_FILTER_FIELDS and value:
+            query = query.filter(getattr(Player, field).ilike(f'%{value}%'))
+        elif field == 'age' and value.isdigit():
+            query = query.filter(Player.age == int(value))
+        i += 1
+    return query
+
 @main_bp.route('/api/players', methods=['GET'])
 @login_required
+@conditional_list('players')
 def get_players():
-    players = Player.query.all()
-    return jsonify([p.to_dict() for p in players])
+    # Without paging params keep the legacy full-list response (used by selects)
+    if not any(k in request.args for k in ('page', 'size', 'after')):
+        players = Player.query.all()
+        return jsonify([p.to_dict() for p in players])
+
+    size = max(1, min(request.args.get('size', 10, type=int), MAX_PAGE_SIZE))
+    query = _filter_players(Player.query, request.args)
+    total = query.order_by(None).count()
+
+    # Keyset mode: ?after=<last id seen>, always ordered by id
+    if 'after' in request.args:
+        after = request.args.get('after', 0, type=int)
+        players = query.filter(Player.id > after).order_by(Player.id).limit(size).all()
+        return jsonify({
+            'data': [p.to_dict() for p in players],
+            'last_row': total,
+            'next_cursor': players[-1].id if len(players) == size else None
+        })
+
+    # Offset mode, shaped for Tabulator's remote pagination
+    sort_field = request.args.get('sort[0][field]', request.args.get('sort', 'id'))
+    sort_dir = request.args.get('sort[0][dir]', request.args.get('dir', 'asc'))
+    if sort_field not in PLAYER_SORT_FIELDS:
+        sort_field = 'id'
+    column = getattr(Player, sort_field)
+    order = column.desc() if sort_dir == 'desc' else column.asc()
+
+    page = max(1, request.args.get('page', 1, type=int))
+    players = query.order_by(order, Player.id).offset((page - 1) * size).limit(size).all()
+    return jsonify({
+        'data': [p.to_dict() for p in players],
+        'last_page': max(1, -(-total // size)),
+        'last_row': total
+    })
 
 @main_bp.route('/api/players', methods=['POST'])
 @login_required
@@ -74,9 +184,100 @@ def add_player():
     log = AuditLog(user_id=current_user.id, action=f"Added player {new_player.full_name}")
     db.session.add(log)
     
+    bump_table_versions('players')
     db.session.commit()
+    invalidate_stats()
     return jsonify({'success': True, 'player': new_player.to_dict()})
 
+PLAYER_IMPORT_FIELDS = {
+    # field: max length (None for unbounded text)
+    'full_name': 100,
+    'position': 50,
+    'team': 50,
+    'phone': 20,
+    'parent_name': 100,
+    'medical_notes': None,
+}
+IMPORT_BATCH_SIZE = 500
+
+def _validate_player_row(raw, partial=False):
+    """Return (clean_row, errors) for one player payload.
+
+    With partial=True only the fields present in ``raw`` are checked and
+    returned, as for a PATCH.
+    """
+    errors = []
+    row = {}
+    for field, max_len in PLAYER_IMPORT_FIELDS.items():
+        if partial and field not in raw:
+            continue
+        value = raw.get(field)
+        value = str(value).strip() if value is not None else ''
+        if max_len and len(value) > max_len:
+            errors.append(f"{field} longer than {max_len} characters")
+        row[field] = value or None
+    if 'full_name' in row and not row['full_name']:
+        errors.append('full_name is required')
+    if not partial or 'age' in raw:
+        try:
+            row['age'] = int(str(raw.get('age', '')).strip())
+            if row['age'] < 0:
+                raise ValueError
+        except ValueError:
+            errors.append('age must be a non-negative integer')
+    return row, errors
+
+@main_bp.route('/api/players/import', methods=['POST'])
+@login_required
+def import_players():
+    """Bulk-create players from a JSON list or a CSV upload.
+
+    All rows are validated first; if any fail nothing is written and the
+    per-row errors are returned. Valid imports are inserted with batched
+    executemany statements in a single transaction.
+    """
+    import csv
+    import io
+
+    if 'file' in request.files:
+        text = request.files['file'].read().decode('utf-8-sig')
+        raw_rows = list(csv.DictReader(io.StringIO(text)))
+    elif request.mimetype == 'text/csv':
+        raw_rows = list(csv.DictReader(io.StringIO(request.get_data(as_text=True))))
+    else:
+        raw_rows = request.get_json(silent=True)
+        if isinstance(raw_rows, dict):
+            raw_rows = raw_rows.get('players')
+    if not isinstance(raw_rows, list) or not raw_rows:
+        return jsonify({'success': False, 'message': 'No players to import'}), 400
+
+    rows, errors = [], []
+    for index, raw in enumerate(raw_rows):
+        if not isinstance(raw, dict):
+            errors.append({'row': index, 'errors': ['row must be an object']})
+            continue
+        row, row_errors = _validate_player_row(raw)
+        if row_errors:
+            errors.append({'row': index, 'errors': row_errors})
+        rows.append(row)
+    if errors:
+        return jsonify({'success': False, 'message': 'Validation failed', 'errors': errors}), 400
+
+    now = datetime.utcnow()
+    for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+        batch = rows[start:start + IMPORT_BATCH_SIZE]
+        for row in batch:
+            row['created_at'] = now
+        db.session.execute(db.insert(Player), batch)
+        db.session.execute(db.insert(AuditLog), [
+            {'user_id': current_user.id, 'action': f"Added player {row['full_name']}", 'timestamp': now}
+            for row in batch
+        ])
+    bump_table_versions('players')
+    db.session.commit()
+    invalidate_stats()
+    return jsonify({'success': True, 'imported': len(rows)})
+
 @main_bp.route('/api/players/<int:id>', methods=['PUT'])
 @login_required
 def update_player(id):
@@ -91,30 +292,119 @@ def update_player(id):
     player.parent_name = data.get('parent_name', player.parent_name)
     player.medical_notes = data.get('medical_notes', player.medical_notes)
     
+    bump_table_versions('players')
     db.session.commit()
     return jsonify({'success': True, 'player': player.to_dict()})
 
+@main_bp.route('/api/players', methods=['PATCH'])
+@login_required
+def patch_players():
+    """Apply partial updates to many players in one transaction.
+
+    Body: [{"id": 1, "team": "U12"}, {"id": 7, "age": 11}, ...]
+    """
+    changes = request.get_json(silent=True)
+    if isinstance(changes, dict):
+        changes = changes.get('updates')
+    if not isinstance(changes, list) or not changes:
+        return jsonify({'success': False, 'message': 'No updates given'}), 400
+
+    # Merge repeated edits of the same row, later fields winning
+    by_id = {}
+    for change in changes:
+        if not isinstance(change, dict) or not isinstance(change.get('id'), int):
+            return jsonify({'success': False, 'message': 'Each update needs an integer id'}), 400
+        by_id.setdefault(change['id'], {}).update(change)
+
+    # Tabulator sends the whole row; ignore read-only keys it includes
+    editable = set(PLAYER_IMPORT_FIELDS) | {'age'}
+    errors, clean = [], {}
+    for player_id, change in by_id.items():
+        row, row_errors = _validate_player_row({k: v for k, v in change.items() if k in editable}, partial=True)
+        if row_errors:
+            errors.append({'id': player_id, 'errors': row_errors})
+        clean[player_id] = row
+
+    players = {p.id: p for p in Player.query.filter(Player.id.in_(clean)).all()}
+    errors.extend({'id': i, 'errors': ['player not found']} for i in clean if i not in players)
+    if errors:
+        return jsonify({'success': False, 'message': 'Validation failed', 'errors': errors}), 400
+
+    for player_id, row in clean.items():
+        for field, value in row.items():
+            setattr(players[player_id], field, value)
+    bump_table_versions('players')
+    db.session.commit()
+    return jsonify({'success': True, 'players': [p.to_dict() for p in players.values()]})
+
 @main_bp.route('/api/players/<int:id>', methods=['DELETE'])
 @login_required
 def delete_player(id):
     player = Player.query.get_or_404(id)
+    if player.files:
+        _delete_player_files(player.files)
+        bump_table_versions('files')
     db.session.delete(player)
+    bump_table_versions('players')
     db.session.commit()
+    _remove_released_blobs()
+    invalidate_stats()
     return jsonify({'success': True})
 
+# --- Admin ---
+
+@main_bp.route('/api/admin/db-pool', methods=['GET'])
+@login_required
+def db_pool_stats():
+    """Connection pool status and checkout wait times for sizing the pool."""
+    from dbpool import checkout_stats
+
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Admin only'}), 403
+    pool = db.engine.pool
+    if request.args.get('reset'):
+        checkout_stats.reset()
+    return jsonify({
+        'pool': type(pool).__name__,
+        'status': pool.status(),
+        'wait': checkout_stats.to_dict(),
+    })
+
 # --- Subscriptions & Payments ---
 
 @main_bp.route('/api/subscriptions', methods=['GET'])
 @login_required
+@conditional_list('subscriptions', 'payments', 'players')
 def get_subscriptions():
-    subs = Subscription.query.all()
-    # Enrich with player name
-    result = []
-    for sub in subs:
-        data = sub.to_dict()
-        data['player_name'] = sub.player.full_name
-        result.append(data)
-    return jsonify(result)
+    # Totals are stored on the row; load players/payments up front so the
+    # listing costs a fixed number of queries regardless of row count
+    subs = Subscription.query \
+        .options(joinedload(Subscription.player), selectinload(Subscription.payments)) \
+        .all()
+    return jsonify([sub.to_dict() for sub in subs])
+
+# Ten years; larger windows only overflow the date arithmetic
+MAX_EXPIRING_DAYS = 3650
+
+@main_bp.route('/api/subscriptions/expiring', methods=['GET'])
+@login_required
+def get_expiring_subscriptions():
+    """Active subscriptions ending within ``days`` (default 7) from today."""
+    from datetime import date, timedelta
+
+    days = request.args.get('days', 7, type=int)
+    if not 0 <= days <= MAX_EXPIRING_DAYS:
+        return jsonify({'success': False, 'message': f'days must be between 0 and {MAX_EXPIRING_DAYS}'}), 400
+    today = date.today()
+    # Range scan on ix_subscriptions_status_end_date
+    subs = Subscription.query \
+        .filter(Subscription.status == 'active',
+                Subscription.end_date >= today,
+                Subscription.end_date <= today + timedelta(days=days)) \
+        .options(joinedload(Subscription.player), selectinload(Subscription.payments)) \
+        .order_by(Subscription.end_date) \
+        .all()
+    return jsonify([sub.to_dict() for sub in subs])
 
 @main_bp.route('/api/subscriptions', methods=['POST'])
 @login_required
@@ -145,7 +435,9 @@ def add_subscription():
         invoice_number=f"INV-{int(datetime.utcnow().timestamp())}"
     )
     db.session.add(new_payment)
+    bump_table_versions('subscriptions', 'payments')
     db.session.commit()
+    invalidate_stats()
     
     sub_dict = new_sub.to_dict()
     sub_dict['last_payment_id'] = new_payment.id
@@ -154,14 +446,83 @@ def add_subscription():
 @main_bp.route('/api/dashboard/stats', methods=['GET'])
 @login_required
 def dashboard_stats():
+    now = time.monotonic()
+    if _stats_cache['data'] is not None and now < _stats_cache['expires_at']:
+        return jsonify(_stats_cache['data'])
+
     player_count = Player.query.count()
     active_subs = Subscription.query.filter_by(status='active').count()
-    total_revenue = db.session.query(db.func.sum(Payment.paid_amount)).scalar() or 0
+    # Read from the rollup instead of summing every payment
+    total_revenue = db.session.query(db.func.sum(RevenueDaily.paid)).scalar() or 0
     
-    return jsonify({
+    data = {
         'player_count': player_count,
         'active_subscriptions': active_subs,
         'total_revenue': total_revenue or 0
+    }
+    _stats_cache['data'] = data
+    _stats_cache['expires_at'] = now + current_app.config['STATS_CACHE_TTL']
+    return jsonify(data)
+
+# --- Reports ---
+
+@main_bp.route('/api/reports/revenue', methods=['GET'])
+@login_required
+# revenue_daily changes on its own when `flask rebuild-revenue` recomputes it
+@conditional_list('subscriptions', 'payments', 'revenue_daily')
+def revenue_report():
+    """Monthly revenue, revenue by subscription type and team, and receivables.
+
+    ``start`` and ``end`` are months (YYYY-MM), both optional and inclusive.
+    Receivables are what was billed minus what was paid up to the end of each
+    month, counting everything before ``start`` too. Reads only revenue_daily.
+    """
+    start = request.args.get('start')
+    end = request.args.get('end')
+    for value in (start, end):
+        if value:
+            try:
+                datetime.strptime(value, '%Y-%m')
+            except ValueError:
+                return jsonify({'success': False, 'message': 'start and end must be months (YYYY-MM)'}), 400
+
+    sums = (db.func.sum(RevenueDaily.billed), db.func.sum(RevenueDaily.paid), db.func.sum(RevenueDaily.payment_count))
+    query = db.session.query(RevenueDaily.month, RevenueDaily.subscription_type, RevenueDaily.team, *sums) \
+        .group_by(RevenueDaily.month, RevenueDaily.subscription_type, RevenueDaily.team)
+    if start:
+        query = query.filter(RevenueDaily.month >= start)
+    if end:
+        query = query.filter(RevenueDaily.month <= end)
+
+    receivable = 0
+    if start:
+        billed_before, paid_before, _ = db.session.query(*sums).filter(RevenueDaily.month < start).one()
+        receivable = (billed_before or 0) - (paid_before or 0)
+
+    months, by_type, by_team = {}, {}, {}
+    for month, sub_type, team, billed, paid, count in query:
+        for groups, key in ((months, month), (by_type, sub_type), (by_team, team)):
+            row = groups.setdefault(key, {'billed': 0, 'paid': 0, 'payments': 0})
+            row['billed'] += billed or 0
+            row['paid'] += paid or 0
+            row['payments'] += count or 0
+
+    monthly = []
+    for month in sorted(months):
+        row = months[month]
+        receivable += row['billed'] - row['paid']
+        monthly.append(dict(row, month=month, receivables=round(receivable, 2)))
+
+    return jsonify({
+        'months': monthly,
+        'by_type': [dict(row, type=key) for key, row in sorted(by_type.items())],
+        'by_team': [dict(row, team=key or None) for key, row in sorted(by_team.items())],
+        'totals': {
+            'billed': sum(row['billed'] for row in monthly),
+            'paid': sum(row['paid'] for row in monthly),
+            'payments': sum(row['payments'] for row in monthly),
+            'receivables': round(receivable, 2),
+        },
     })
 
 # --- Subscriptions Management ---
@@ -170,12 +531,71 @@ def dashboard_stats():
 @login_required
 def delete_subscription(id):
     sub = Subscription.query.get_or_404(id)
-    # Delete associated payments first or handle via cascade (doing manual here for safety)
-    Payment.query.filter_by(subscription_id=id).delete()
+    # Delete associated payments first or handle via cascade (doing manual here for safety).
+    # Through the ORM, not a bulk delete, so the revenue rollup listeners see them
+    for payment in sub.payments:
+        db.session.delete(payment)
     db.session.delete(sub)
+    bump_table_versions('subscriptions', 'payments')
     db.session.commit()
+    invalidate_stats()
     return jsonify({'success': True})
 
+# --- Exports ---
+
+EXPORT_TABLES = {
+    'players': Player,
+    'subscriptions': Subscription,
+    'payments': Payment,
+}
+EXPORT_BATCH_SIZE = 500
+
+def _export_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+@main_bp.route('/api/export/<table>', methods=['GET'])
+@login_required
+def export_table(table):
+    """Stream a whole table as CSV (default) or NDJSON in constant memory."""
+    import csv
+    import io
+    import json
+    from flask import Response, stream_with_context
+
+    model = EXPORT_TABLES.get(table)
+    fmt = request.args.get('format', 'csv')
+    if model is None or fmt not in ('csv', 'ndjson'):
+        return jsonify({'success': False, 'message': 'Unknown table or format'}), 404
+
+    columns = [c.name for c in model.__table__.columns]
+    stmt = db.select(*model.__table__.columns).order_by(model.__table__.c.id) \
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    def generate():
+        result = db.session.execute(stmt)
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        if fmt == 'csv':
+            writer.writerow(columns)
+        for batch in result.partitions():
+            for row in batch:
+                values = [_export_value(v) for v in row]
+                if fmt == 'csv':
+                    writer.writerow(values)
+                else:
+                    buf.write(json.dumps(dict(zip(columns, values))) + '\n')
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        yield buf.getvalue()
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    filename = f"{table}_{datetime.utcnow():%Y%m%d}.{fmt}"
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
 # --- File Management ---
 
 @main_bp.route('/api/files/upload', methods=['POST'])
@@ -194,31 +614,137 @@ def upload_file():
         from werkzeug.utils import secure_filename
         filename = secure_filename(file.filename)
         
-        # Create player specific folder
-        player_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], str(player_id))
-        os.makedirs(player_folder, exist_ok=True)
-        
-        file_path = os.path.join(player_folder, filename)
-        file.save(file_path)
-        
-        # Save to DB
-        # Store relative path for portability
-        rel_path = os.path.join(str(player_id), filename)
-        
-        new_file = File(
-            player_id=player_id,
-            file_path=rel_path,
-            file_type=filename.rsplit('.', 1)[1].lower() if '.' in filename else 'unknown'
-        )
-        db.session.add(new_file)
-        db.session.commit()
+        # Stored by content, so re-uploading a name never overwrites another file
+        staged, sha256, size = _blob_store().stage_stream(file.stream)
         
+        new_file = _add_player_file(player_id, filename, sha256, size, staged)
         return jsonify({'success': True, 'file': new_file.to_dict()})
     
     return jsonify({'success': False, 'message': 'Invalid data'}), 400
 
+def _blob_store():
+    from blobstore import BlobStore
+    return BlobStore(current_app.config['BLOB_FOLDER'])
+
+def _add_player_file(player_id, filename, sha256, size, staged_path):
+    """Record an upload staged at ``staged_path``, then move its bytes into the blob store."""
+    # Store relative path for portability
+    rel_path = os.path.join(str(player_id), filename)
+    
+    new_file = File(
+        player_id=player_id,
+        file_path=rel_path,
+        file_type=filename.rsplit('.', 1)[1].lower() if '.' in filename else 'unknown',
+        blob_sha256=sha256,
+        size=size
+    )
+    db.session.add(new_file)
+    bump_table_versions('files')
+    try:
+        db.session.commit()
+    except Exception:
+        os.remove(staged_path)
+        raise
+    # Only once the reference is committed: a delete of the last other copy
+    # racing with this upload then either keeps the blob or lets ingest()
+    # put this copy in its place (see BlobStore.remove_unreferenced)
+    _blob_store().ingest(staged_path, sha256)
+    _queue_preview(new_file)
+    return new_file
+
+def _preview_cache():
+    from previews import PreviewCache
+    return PreviewCache(current_app.config['PREVIEW_FOLDER'], current_app.config['PREVIEW_SIZE'])
+
+def _queue_preview(file):
+    """Start rendering a file's thumbnail in the background; returns its status or None."""
+    from previews import PREVIEW_TYPES
+
+    if not file.blob_sha256 or file.file_type not in PREVIEW_TYPES:
+        return None
+    try:
+        return _preview_cache().submit(_blob_store().path_for(file.blob_sha256), file.blob_sha256,
+                                       file.file_type, current_app.config['PREVIEW_WORKERS'])
+    except OSError:
+        # e.g. read-only hosts; the upload itself has already succeeded
+        return None
+
+def _upload_store():
+    return UploadStore(current_app.config['UPLOAD_STAGING_DIR'], current_app.config['UPLOAD_MAX_SIZE'])
+
+def _upload_status(store, upload_id):
+    meta = store.meta(upload_id)
+    return {'success': True, 'upload_id': upload_id, 'filename': meta['filename'],
+            'size': meta['size'], 'received': store.received(upload_id),
+            'chunk_size': current_app.config['UPLOAD_CHUNK_SIZE']}
+
+@main_bp.errorhandler(UploadError)
+def upload_error(e):
+    return jsonify({'success': False, 'message': e.message}), e.status
+
+@main_bp.route('/api/uploads', methods=['POST'])
+@login_required
+def start_upload():
+    """Begin a chunked upload: {player_id, filename, size}.
+
+    Send the bytes with PUT /api/uploads/<id>?offset=N, then POST
+    /api/uploads/<id>/complete with {sha256}. GET /api/uploads/<id> reports
+    how many bytes arrived, which is where an interrupted client resumes.
+    """
+    from werkzeug.utils import secure_filename
+
+    data = request.get_json(silent=True) or {}
+    player = db.session.get(Player, data.get('player_id') or 0)
+    if not player:
+        return jsonify({'success': False, 'message': 'Player not found'}), 404
+    filename = secure_filename(data.get('filename') or '')
+    if not filename:
+        return jsonify({'success': False, 'message': 'filename is required'}), 400
+
+    store = _upload_store()
+    store.purge_stale(current_app.config['UPLOAD_STALE_SECONDS'])
+    upload_id = store.create(data.get('size'), data.get('sha256'),
+                             player_id=player.id, filename=filename, user_id=current_user.id)
+    return jsonify(_upload_status(store, upload_id)), 201
+
+@main_bp.route('/api/uploads/<upload_id>', methods=['GET'])
+@login_required
+def upload_status(upload_id):
+    return jsonify(_upload_status(_upload_store(), upload_id))
+
+@main_bp.route('/api/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def upload_chunk(upload_id):
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'success': False, 'message': 'offset is required'}), 400
+    store = _upload_store()
+    # Read the body as a stream so a chunk is never held in memory whole
+    received = store.write_chunk(upload_id, offset, request.stream)
+    return jsonify({'success': True, 'upload_id': upload_id, 'received': received})
+
+@main_bp.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_upload(upload_id):
+    store = _upload_store()
+    blobs = _blob_store()
+    staged = blobs.temp_path()
+    data = request.get_json(silent=True) or {}
+    meta = store.finish(upload_id, staged, data.get('sha256'))
+    new_file = _add_player_file(meta['player_id'], meta['filename'], meta['sha256'], meta['size'], staged)
+    return jsonify({'success': True, 'file': new_file.to_dict()})
+
+@main_bp.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_upload(upload_id):
+    store = _upload_store()
+    store.meta(upload_id)
+    store.discard(upload_id)
+    return jsonify({'success': True})
+
 @main_bp.route('/api/players/<int:player_id>/files', methods=['GET'])
 @login_required
+@conditional_list('files')
 def get_player_files(player_id):
     files = File.query.filter_by(player_id=player_id).all()
     return jsonify([f.to_dict() for f in files])
@@ -226,164 +752,196 @@ def get_player_files(player_id):
 @main_bp.route('/api/files/<int:file_id>/download', methods=['GET'])
 @login_required
 def download_file(file_id):
-    from flask import send_from_directory
+    """Send a file with Range, ETag and Last-Modified support.
+
+    With FILE_SEND_MODE set to 'x-sendfile' or 'x-accel' only the headers are
+    produced here and the fronting web server streams the bytes, serving Range
+    requests itself.
+    """
+    from flask import abort
+    from werkzeug.utils import safe_join, send_file
+
     file = File.query.get_or_404(file_id)
     
-    # Construct absolute path
     # file.file_path is stored as "player_id/filename"
-    directory = os.path.join(current_app.config['UPLOAD_FOLDER'], os.path.dirname(file.file_path))
     filename = os.path.basename(file.file_path)
-    
-    return send_from_directory(directory, filename, as_attachment=True)
+    upload_root = current_app.config['UPLOAD_FOLDER']
+    if file.blob_sha256:
+        path = _blob_store().path_for(file.blob_sha256)
+        # The content hash is the same on every host and across re-uploads
+        etag = file.blob_sha256[:32]
+    else:
+        path = safe_join(upload_root, file.file_path)
+        etag = True
+    if not path or not os.path.isfile(path):
+        abort(404)
+
+    mode = current_app.config['FILE_SEND_MODE']
+    accel_path = os.path.relpath(path, upload_root)
+    if mode == 'x-accel' and accel_path.startswith(os.pardir):
+        # Outside the aliased folder (e.g. BLOB_FOLDER moved elsewhere)
+        mode = 'direct'
+    offload = mode in ('x-sendfile', 'x-accel')
+
+    response = send_file(path, request.environ, as_attachment=True, download_name=filename,
+                         etag=etag, use_x_sendfile=offload, conditional=not offload,
+                         response_class=current_app.response_class)
+    response.accept_ranges = 'bytes'
+    if offload:
+        # Answer If-None-Match / If-Modified-Since here; leave Range to the web server
+        response = response.make_conditional(request.environ)
+        del response.headers['Content-Length']
+        sendfile_path = response.headers.pop('X-Sendfile')
+        if response.status_code != 304:
+            if mode == 'x-accel':
+                response.headers['X-Accel-Redirect'] = \
+                    current_app.config['FILE_ACCEL_PREFIX'].rstrip('/') + '/' + accel_path.replace(os.sep, '/')
+            else:
+                response.headers['X-Sendfile'] = sendfile_path
+    return response
+
+@main_bp.route('/api/files/<int:file_id>/thumbnail', methods=['GET'])
+@login_required
+def file_thumbnail(file_id):
+    """Small JPEG preview; 202 while it is still being rendered."""
+    from flask import send_file
+
+    file = File.query.get_or_404(file_id)
+    status = _queue_preview(file)
+    if status == 'done':
+        # Previews are keyed by content, which never changes for a file id
+        response = send_file(_preview_cache().path_for(file.blob_sha256), mimetype='image/jpeg',
+                             etag=f"{file.blob_sha256[:32]}-{current_app.config['PREVIEW_SIZE']}",
+                             max_age=365 * 24 * 3600, conditional=True)
+        response.cache_control.public = False
+        response.cache_control.private = True
+        response.cache_control.immutable = True
+        return response
+    if status == 'pending':
+        response = jsonify({'success': True, 'status': 'pending'})
+        response.status_code = 202
+        response.headers['Retry-After'] = '2'
+        return response
+    return jsonify({'success': False, 'message': 'No preview for this file'}), 404
 
 @main_bp.route('/api/files/<int:file_id>', methods=['DELETE'])
 @login_required
 def delete_file(file_id):
     file = File.query.get_or_404(file_id)
-    
-    # Remove from disk
-    full_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.file_path)
-    if os.path.exists(full_path):
-        os.remove(full_path)
-        
-    db.session.delete(file)
+    _delete_player_files([file])
+    bump_table_versions('files')
     db.session.commit()
+    _remove_released_blobs()
     return jsonify({'success': True})
 
+def _delete_player_files(files):
+    for file in files:
+        if not file.blob_sha256:
+            # Uploaded before blob storage: the row owns its file
+            full_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.file_path)
+            if os.path.exists(full_path):
+                os.remove(full_path)
+        # Blob reference counts are kept by the File listeners in models.py
+        db.session.delete(file)
+
+def _remove_released_blobs():
+    """Delete blob bodies whose last reference went in the commit just made, with their previews."""
+    removed = _blob_store().remove_unreferenced(pop_released_blobs(), blob_exists)
+    if removed:
+        cache = _preview_cache()
+        for sha256 in removed:
+            cache.remove(sha256)
+
 
 # --- Invoices ---
+def _invoice_cache():
+    from invoices import InvoiceCache
+    return InvoiceCache(current_app.config['INVOICE_CACHE_DIR'],
+                        current_app.config['INVOICE_CACHE_MAX_BYTES'])
+
 @main_bp.route('/api/payments/<int:id>/invoice', methods=['GET'])
 @login_required
 def download_invoice(id):
-    import qrcode
-    from fpdf import FPDF
-    import tempfile
+    from invoices import invoice_fields, render_invoice
     from flask import send_file
+    import io
 
     payment = Payment.query.get_or_404(id)
     sub = Subscription.query.get(payment.subscription_id)
     player = Player.query.get(sub.player_id)
 
-    # Generate QR Code
-    qr_data = f"Invoice:{payment.invoice_number}\nAmount:{payment.paid_amount}\nPlayer:{player.full_name}\nDate:{payment.payment_date}"
-    qr = qrcode.make(qr_data)
-    qr_path = os.path.join(tempfile.gettempdir(), f"qr_{id}.png")
-    qr.save(qr_path)
-
-    # Custom PDF Class
-    class InvoicePDF(FPDF):
-        def header(self):
-            # Logo Text
-            self.set_font('Arial', 'B', 24)
-            self.set_text_color(0, 255, 136) # Neon Green
-            self.cell(0, 15, 'Boshkash Academy', 0, 1, 'L')
-            
-            # Subheader
-            self.set_font('Arial', '', 10)
-            self.set_text_color(150, 150, 150)
-            self.cell(0, 5, 'Professional Football Training', 0, 1, 'L')
-            
-            # Line break
-            self.ln(10)
-            
-            # Invoice Title (Right aligned)
-            self.set_y(10)
-            self.set_font('Arial', 'B', 30)
-            self.set_text_color(220, 220, 220)
-            self.cell(0, 15, 'INVOICE', 0, 1, 'R')
-
-        def footer(self):
-            self.set_y(-15)
-            self.set_font('Arial', 'I', 8)
-            self.set_text_color(128)
-            self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
-
-    # Create PDF
-    pdf = InvoicePDF()
-    pdf.add_page()
-    pdf.set_auto_page_break(auto=True, margin=15)
-
-    # Colors
-    bg_color = (245, 245, 245)
-    header_color = (30, 41, 59) # Dark Blue
-    text_color = (30, 30, 30)
-
-    # --- Invoice Info Block ---
-    pdf.set_fill_color(*bg_color)
-    pdf.rect(10, 35, 190, 40, 'F')
-    
-    pdf.set_y(40)
-    pdf.set_font("Arial", 'B', 10)
-    pdf.set_text_color(100, 100, 100)
-    
-    # Left Column (Bill To)
-    pdf.set_x(15)
-    pdf.cell(40, 5, "BILL TO:", 0, 1)
-    pdf.set_font("Arial", 'B', 14)
-    pdf.set_text_color(*text_color)
-    pdf.set_x(15)
-    pdf.cell(40, 8, player.full_name, 0, 1)
-    pdf.set_font("Arial", '', 10)
-    pdf.set_x(15)
-    pdf.cell(40, 5, f"Team: {player.team or 'N/A'}", 0, 1)
-
-    # Right Column (Invoice Details)
-    # Re-position for right column
-    pdf.set_y(40)
-    pdf.set_x(120)
-    pdf.set_font("Arial", 'B', 10)
-    pdf.set_text_color(100, 100, 100)
-    pdf.cell(30, 5, "Invoice #:", 0, 0)
-    pdf.set_font("Arial", '', 10)
-    pdf.set_text_color(*text_color)
-    pdf.cell(40, 5, payment.invoice_number, 0, 1, 'R')
-    
-    pdf.set_x(120)
-    pdf.set_font("Arial", 'B', 10)
-    pdf.set_text_color(100, 100, 100)
-    pdf.cell(30, 5, "Date:", 0, 0)
-    pdf.set_font("Arial", '', 10)
-    pdf.set_text_color(*text_color)
-    pdf.cell(40, 5, payment.payment_date.strftime('%Y-%m-%d'), 0, 1, 'R')
-    
-    pdf.ln(20)
-
-    # --- Table Header ---
-    pdf.set_fill_color(*header_color)
-    pdf.set_text_color(255, 255, 255)
-    pdf.set_font("Arial", 'B', 11)
-    pdf.cell(110, 10, "  Description", 0, 0, 'L', 1)
-    pdf.cell(40, 10, "Type", 0, 0, 'C', 1)
-    pdf.cell(40, 10, "Amount  ", 0, 1, 'R', 1)
-
-    # --- Table Rows ---
-    pdf.set_text_color(*text_color)
-    pdf.set_font("Arial", '', 11)
-    
-    pdf.cell(110, 12, f"  Subscription Fee ({sub.start_date.strftime('%b %Y')})", "B", 0, 'L')
-    pdf.cell(40, 12, sub.type, "B", 0, 'C')
-    pdf.cell(40, 12, f"{payment.paid_amount:.2f}  ", "B", 1, 'R')
-
-    # --- Total ---
-    pdf.ln(5)
-    pdf.set_font("Arial", 'B', 14)
-    pdf.cell(150, 12, "Total Paid", 0, 0, 'R')
-    pdf.set_text_color(0, 128, 0) # Green
-    pdf.cell(40, 12, f"${payment.paid_amount:.2f}  ", 0, 1, 'R')
-
-    # --- QR Code & Footer Note ---
-    pdf.ln(10)
-    pdf.image(qr_path, x=15, y=pdf.get_y(), w=30)
-    
-    pdf.set_y(pdf.get_y() + 10)
-    pdf.set_x(50)
-    pdf.set_font("Arial", 'I', 9)
-    pdf.set_text_color(100, 100, 100)
-    pdf.multi_cell(0, 5, "Thank you for your business. This is a computer generated invoice and requires no signature.")
+    cache = _invoice_cache()
+    fields = invoice_fields(payment, sub, player)
+    download_name = f"Invoice_{payment.invoice_number}.pdf"
+
+    pdf_path = cache.get(fields)
+    if pdf_path:
+        return send_file(pdf_path, as_attachment=True, download_name=download_name)
+
+    pdf_bytes = render_invoice(fields)
+    cache.put(fields, pdf_bytes)
+    return send_file(io.BytesIO(pdf_bytes), mimetype='application/pdf',
+                     as_attachment=True, download_name=download_name)
+
+@main_bp.route('/api/payments/<int:id>/invoice/render', methods=['POST'])
+@login_required
+def enqueue_invoice(id):
+    from invoices import invoice_fields
 
-    # Output
-    pdf_path = os.path.join(tempfile.gettempdir(), f"invoice_{id}.pdf")
-    pdf.output(pdf_path)
+    payment = Payment.query.get_or_404(id)
+    sub = Subscription.query.get(payment.subscription_id)
+    player = Player.query.get(sub.player_id)
+
+    cache = _invoice_cache()
+    job_id = cache.submit(invoice_fields(payment, sub, player),
+                          current_app.config['INVOICE_WORKERS'])
+    status = cache.job_status(job_id)
+    return jsonify({'success': True, 'job_id': job_id, 'status': status}), 200 if status == 'done' else 202
+
+@main_bp.route('/api/invoice-jobs/<job_id>', methods=['GET'])
+@login_required
+def invoice_job_status(job_id):
+    status = _invoice_cache().job_status(job_id)
+    if status is None:
+        return jsonify({'success': False, 'message': 'Unknown job'}), 404
+    return jsonify({'success': True, 'job_id': job_id, 'status': status})
 
-    return send_file(pdf_path, as_attachment=True, download_name=f"Invoice_{payment.invoice_number}.pdf")
+@main_bp.route('/api/invoice-jobs/<job_id>/result', methods=['GET'])
+@login_required
+def invoice_job_result(job_id):
+    from flask import send_file
 
+    path = _invoice_cache().job_result(job_id)
+    if not path:
+        return jsonify({'success': False, 'message': 'Invoice not ready'}), 404
+    payment = Payment.query.get_or_404(int(job_id.split('-', 1)[0]))
+    return send_file(path, as_attachment=True, download_name=f"Invoice_{payment.invoice_number}.pdf")
+
+@main_bp.route('/api/invoices/export', methods=['GET'])
+@login_required
+def export_invoices():
+    """Stream a ZIP of every invoice with a payment date in [start, end]."""
+    from invoices import invoice_fields, iter_invoice_zip
+    from flask import Response
+
+    try:
+        start = datetime.fromisoformat(request.args['start'])
+        end = datetime.fromisoformat(request.args['end'])
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'message': 'start and end dates (YYYY-MM-DD) are required'}), 400
+    if len(request.args['end']) == 10:
+        # A bare end date includes the whole day
+        end = end.replace(hour=23, minute=59, second=59, microsecond=999999)
+
+    rows = db.session.query(Payment, Subscription, Player) \
+        .join(Subscription, Payment.subscription_id == Subscription.id) \
+        .join(Player, Subscription.player_id == Player.id) \
+        .filter(Payment.payment_date >= start, Payment.payment_date <= end) \
+        .order_by(Payment.payment_date) \
+        .all()
+    fields_list = [invoice_fields(payment, sub, player) for payment, sub, player in rows]
+
+    stream = iter_invoice_zip(fields_list, _invoice_cache(), current_app.config['INVOICE_WORKERS'])
+    filename = f"Invoices_{start:%Y-%m-%d}_{end:%Y-%m-%d}.zip"
+    return Response(stream, mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
@@ -0,0 +1,164 @@
+"""Chunked, resumable uploads staged on disk until they are complete.
+
+A client starts an upload with the expected size, sends the bytes as PUT
+chunks at an explicit offset and finishes with a complete call carrying the
+SHA-256, which is checked against what arrived. The client can hash while it
+uploads instead of reading the file twice. All state lives in the staging
+directory (``<id>.json`` plus
+``<id>.part``), so any worker can take the next chunk and an interrupted
+client resumes from the byte count the server reports.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+
+UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+COPY_BUFSIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Rejected upload request; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BUFSIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _check_sha256(sha256):
+    """Normalise an optional client-supplied digest, rejecting malformed ones."""
+    if sha256 is None:
+        return None
+    sha256 = str(sha256).lower()
+    if not SHA256_RE.match(sha256):
+        raise UploadError('sha256 must be a hex SHA-256 digest')
+    return sha256
+
+
+class UploadStore:
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+    def _path(self, upload_id, suffix):
+        if not UPLOAD_ID_RE.match(upload_id or ''):
+            raise UploadError('Unknown upload', 404)
+        return os.path.join(self.directory, upload_id + suffix)
+
+    def create(self, size, sha256=None, **meta):
+        """Stage a new upload and return its id; extra keyword args are kept as metadata.
+
+        ``sha256`` may be given here or later to finish().
+        """
+        if not isinstance(size, int) or size < 0:
+            raise UploadError('size must be a non-negative integer')
+        if size > self.max_size:
+            raise UploadError(f'File is larger than the {self.max_size} byte limit', 413)
+        sha256 = _check_sha256(sha256)
+
+        os.makedirs(self.directory, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        open(self._path(upload_id, '.part'), 'wb').close()
+        with open(self._path(upload_id, '.json'), 'w') as f:
+            json.dump(dict(meta, size=size, sha256=sha256, created=time.time()), f)
+        return upload_id
+
+    def meta(self, upload_id):
+        try:
+            with open(self._path(upload_id, '.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise UploadError('Unknown upload', 404)
+
+    def received(self, upload_id):
+        try:
+            return os.path.getsize(self._path(upload_id, '.part'))
+        except OSError:
+            raise UploadError('Unknown upload', 404)
+
+    def write_chunk(self, upload_id, offset, stream):
+        """Write the chunk read from ``stream`` at ``offset``; returns bytes received so far.
+
+        The offset may point back into data already received (a chunk resent
+        after a lost response) but never past the end, so the staged file has
+        no gaps. A chunk cut off mid-way keeps what arrived; the client resumes
+        from the reported size.
+        """
+        size = self.meta(upload_id)['size']
+        received = self.received(upload_id)
+        if offset < 0 or offset > received:
+            raise UploadError(f'Expected a chunk at offset {received} or earlier', 409)
+
+        with open(self._path(upload_id, '.part'), 'r+b') as f:
+            f.seek(offset)
+            position = offset
+            for block in iter(lambda: stream.read(COPY_BUFSIZE), b''):
+                if position + len(block) > size:
+                    raise UploadError(f'Chunk runs past the declared size of {size} bytes', 413)
+                f.write(block)
+                position += len(block)
+        return self.received(upload_id)
+
+    def finish(self, upload_id, dest_path, sha256=None):
+        """Verify the staged file and move it to ``dest_path``; returns the metadata.
+
+        The file must match ``sha256`` and any digest given at create().
+        """
+        meta = self.meta(upload_id)
+        part = self._path(upload_id, '.part')
+        expected = {digest for digest in (_check_sha256(sha256), meta.get('sha256')) if digest}
+        if not expected:
+            raise UploadError('sha256 is required')
+        received = self.received(upload_id)
+        if received != meta['size']:
+            raise UploadError(f'Upload incomplete: {received} of {meta["size"]} bytes received', 409)
+        actual = file_sha256(part)
+        if expected != {actual}:
+            # The bytes are unusable; drop them so the client starts over
+            self.discard(upload_id)
+            raise UploadError('SHA-256 mismatch, upload discarded', 422)
+
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        shutil.move(part, dest_path)
+        self.discard(upload_id)
+        meta['sha256'] = actual
+        return meta
+
+    def discard(self, upload_id):
+        for suffix in ('.part', '.json'):
+            try:
+                os.remove(self._path(upload_id, suffix))
+            except OSError:
+                pass
+
+    def purge_stale(self, max_age):
+        """Remove uploads untouched for ``max_age`` seconds."""
+        cutoff = time.time() - max_age
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            upload_id, ext = os.path.splitext(name)
+            if ext != '.json' or not UPLOAD_ID_RE.match(upload_id):
+                continue
+            try:
+                stale = max(os.path.getmtime(os.path.join(self.directory, upload_id + suffix))
+                            for suffix in ('.json', '.part')) < cutoff
+            except OSError:
+                stale = True
+            if stale:
+                self.discard(upload_id)